@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from common.generations import bump_generation, generation
+from common.metrics import Counter
+from students.models import Student
+
+# bumped on every student or application write, which retires the cached counts
+GENERATION_KEY = 'dashboard-counts-generation'
+DASHBOARD_COUNTS = Counter('services_dashboard_counts_total', 'Dashboard count lookups, by whether the cache had them.',
+                           ['cache'])
+
+
+def dashboard_counts():
+    """Student and TC application totals shown on the dashboard, cached until a student or application changes."""
+    key = cache_key()
+    counts = cache.get(key)
+    DASHBOARD_COUNTS.inc(cache='miss' if counts is None else 'hit')
+    if counts is None:
+        # one pass over students LEFT JOIN tc applications; distinct because a student row repeats per application
+        counts = Student.objects.aggregate(
+            total_students=Count('id', distinct=True),
+            students_pending_verfication=Count('id', filter=Q(data_verified=False), distinct=True),
+            total_tc_pending_applications=Count('tcapplication', filter=Q(tcapplication__tc_issued=False), distinct=True),
+            total_tc_issued=Count('tcapplication', filter=Q(tcapplication__tc_issued=True), distinct=True),
+        )
+        cache.set(key, counts, settings.DASHBOARD_COUNTS_TIMEOUT)
+    return counts
+
+
+def cache_key():
+    return 'dashboard-counts:{}'.format(generation(GENERATION_KEY))
+
+
+def invalidate_dashboard_counts():
+    bump_generation(GENERATION_KEY)
@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from students.models import Student
+from tc.models import TcApplication
+from .counters import invalidate_dashboard_counts
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=TcApplication)
+@receiver(post_delete, sender=TcApplication)
+def invalidate_counts(sender, instance, **kwargs):
+    # after commit, so a dashboard hit in between cannot cache the old numbers again
+    transaction.on_commit(invalidate_dashboard_counts)
@@ -1,3 +1,44 @@
+from datetime import date
+
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from admin_tools.models import Department
+from students.importer import StudentImporter
+from students.models import Student
+from students.tests import make_csv, make_row
+from .counters import dashboard_counts
+
+
+class DashboardCountsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='Computer Engineering', code='CT')
+
+    def add_students(self, *admission_numbers):
+        # as the importer writes them: no post_save, so nothing here clears the cache
+        Student.objects.bulk_create(Student(name=number, admission_number=number, department=self.department,
+                                            date_of_join=date(2021, 8, 1)) for number in admission_numbers)
+
+    def test_counts_are_cached_until_a_student_changes(self):
+        self.add_students('1001')
+        self.assertEqual(dashboard_counts()['total_students'], 1)
+        self.add_students('1002')
+        self.assertEqual(dashboard_counts()['total_students'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(name='1003', admission_number='1003', department=self.department)
+        self.assertEqual(dashboard_counts()['total_students'], 3)
+
+    def test_cached_counts_cost_no_queries(self):
+        self.add_students('1001')
+        dashboard_counts()
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_counts()['total_students'], 1)
+
+    def test_import_batch_retires_cached_counts(self):
+        self.add_students('1001')
+        self.assertEqual(dashboard_counts()['total_students'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentImporter().import_csv(make_csv([make_row('1002')]))
+        self.assertEqual(dashboard_counts()['total_students'], 2)
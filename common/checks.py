@@ -0,0 +1,72 @@
+import logging
+
+from django.conf import settings
+from django.core.checks import ERROR, Warning, register, run_checks
+
+logger = logging.getLogger(__name__)
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cached_loaders(template_settings):
+    for loader in template_settings.get('OPTIONS', {}).get('loaders') or []:
+        if isinstance(loader, (list, tuple)) and loader[0] == 'django.template.loaders.cached.Loader':
+            return True
+    return False
+
+
+@register()
+def production_settings_check(app_configs, **kwargs):
+    """Warns about settings that slow every request down when SETTINGS_PROFILE is production."""
+    if getattr(settings, 'SETTINGS_PROFILE', None) != 'production':
+        return []
+    warnings = []
+    if settings.DEBUG:
+        warnings.append(Warning(
+            'DEBUG is on in production.',
+            hint='Every SQL query of a request is kept in memory. Remove DEBUG from .env.',
+            id='common.W001',
+        ))
+    for template_settings in settings.TEMPLATES:
+        if template_settings['BACKEND'] == 'django.template.backends.django.DjangoTemplates' \
+                and not cached_loaders(template_settings):
+            warnings.append(Warning(
+                'Templates are not loaded through the cached loader.',
+                hint="Wrap the loaders in 'django.template.loaders.cached.Loader'.",
+                id='common.W002',
+            ))
+    for alias, database in settings.DATABASES.items():
+        if not database.get('CONN_MAX_AGE'):
+            warnings.append(Warning(
+                "Database '{}' opens a new connection for every request.".format(alias),
+                hint='Set CONN_MAX_AGE in .env.',
+                id='common.W003',
+            ))
+    if settings.CACHES['default']['BACKEND'] in PER_PROCESS_CACHES:
+        warnings.append(Warning(
+            'The default cache is not shared between worker processes.',
+            hint='Point CACHE_URL at a file, redis or memcached cache.',
+            id='common.W004',
+        ))
+    if settings.SESSION_ENGINE in ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.file'):
+        warnings.append(Warning(
+            'Sessions are read from {} on every request.'.format(settings.SESSION_ENGINE.rsplit('.', 1)[-1]),
+            hint="Use 'django.contrib.sessions.backends.cached_db'.",
+            id='common.W005',
+        ))
+    return warnings
+
+
+def log_startup_checks():
+    """Runs the system checks and logs what they find, when SETTINGS_PROFILE is production.
+
+    gunicorn and uvicorn start without the checks manage.py runs, so the
+    WSGI and ASGI entry points call this.
+    """
+    if getattr(settings, 'SETTINGS_PROFILE', None) != 'production':
+        return
+    for message in run_checks():
+        logger.log(logging.ERROR if message.level >= ERROR else logging.WARNING, '%s', message)
@@ -0,0 +1,83 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections
+
+from .profiling import timed
+
+_executors = {}
+_lock = threading.Lock()
+
+
+class ExecutorBusy(Exception):
+    """More work is queued for an executor than HEAVY_WORK_EXECUTORS allows."""
+
+
+def _init_process():
+    # spawned workers start without Django
+    if not apps.ready:
+        django.setup()
+
+
+def _in_thread(func, *args):
+    # pool threads keep their database connections between jobs like request threads do
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def get_executor(name):
+    """The executor and its free queue slots for one entry of HEAVY_WORK_EXECUTORS, created on first use."""
+    with _lock:
+        if name not in _executors:
+            kind, workers, max_queued = settings.HEAVY_WORK_EXECUTORS[name]
+            if kind == 'process':
+                # spawned rather than forked, so workers do not inherit the web process's database connections
+                executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_process,
+                                               mp_context=multiprocessing.get_context('spawn'))
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='heavy-' + name)
+            _executors[name] = (kind, executor, threading.BoundedSemaphore(max_queued))
+        return _executors[name]
+
+
+def submit_heavy(name, func, *args, wait=False):
+    """Queues func(*args) on the named executor and returns its Future.
+
+    Raises ExecutorBusy when the executor already has its maximum of jobs
+    running or queued, or with wait=True blocks until one of them finishes.
+    Process executors need func and args to be picklable.
+    """
+    kind, executor, slots = get_executor(name)
+    if not slots.acquire(blocking=wait):
+        raise ExecutorBusy(name)
+    try:
+        if kind == 'process':
+            future = executor.submit(func, *args)
+        else:
+            future = executor.submit(_in_thread, func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # the slot is freed when the job finishes, even if the request is gone by then
+    future.add_done_callback(lambda future: slots.release())
+    return future
+
+
+async def run_heavy(name, func, *args):
+    """Runs func(*args) on the named executor and waits for it without holding a thread.
+
+    Async views use this for CPU-bound work instead of sync_to_async, whose
+    default thread is the one every synchronous view runs in under ASGI.
+    Raises ExecutorBusy as submit_heavy() does.
+    """
+    future = submit_heavy(name, func, *args)
+    with timed('heavy:' + name):
+        return await asyncio.wrap_future(future)
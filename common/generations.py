@@ -0,0 +1,20 @@
+import time
+
+from django.core.cache import cache
+
+
+def generation(key):
+    """The current value of a generation counter kept in the cache, for building other cache keys from.
+
+    Bumping it retires every key built from the old value at once, in every
+    process sharing the cache, without a query on the read side.
+    """
+    return cache.get_or_set(key, time.time_ns, None)
+
+
+def bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted; start from a value no earlier generation could have had
+        cache.set(key, time.time_ns(), None)
@@ -0,0 +1,37 @@
+from functools import lru_cache
+
+from crispy_forms.helper import FormHelper
+from crispy_forms.layout import Button, Column, Layout, Row, Submit
+from django.urls import reverse
+
+COLUMN_CSS_CLASS = 'form-group col-md-4 mb-0'
+
+
+@lru_cache(maxsize=None)
+def grid(fields, per_row=3):
+    """The form-row Rows for a tuple of field names, per_row columns each.
+
+    Built once and shared by every form instance laying out the same fields;
+    rendering does not change Rows or Columns. Buttons do get changed (their
+    value is rendered as a template), so those are made per instance.
+    """
+    return tuple(
+        Row(*[Column(field, css_class=COLUMN_CSS_CLASS) for field in fields[index:index + per_row]],
+            css_class='form-row')
+        for index in range(0, len(fields), per_row))
+
+
+@lru_cache(maxsize=None)
+def cancel_url(url_name):
+    return reverse(url_name)
+
+
+def form_helper(fields, buttons, cancel_url_name):
+    """FormHelper with the cached grid for fields, a Submit per buttons item and a Cancel button."""
+    helper = FormHelper()
+    helper.layout = Layout(*grid(tuple(fields)))
+    for name, value in buttons.items():
+        helper.layout.append(Submit(name, value))
+    helper.layout.append(Button('cancel', 'Cancel', css_class='btn-primary',
+                                onclick="window.location.href = '{}';".format(cancel_url(cancel_url_name))))
+    return helper
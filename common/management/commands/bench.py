@@ -0,0 +1,272 @@
+import csv
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from admin_tools.models import AcademicSession, Classroom, Department
+from common import metrics
+from students.importer import COLUMNS, DATE_FORMAT, StudentImporter
+from students.models import Student
+from tc import numbering
+from tc.models import TcApplication
+
+DEPARTMENTS = [
+    ('Computer Engineering', 'CT'),
+    ('Electronics Engineering', 'EL'),
+    ('Electrical and Electronics Engineering', 'EE'),
+    ('Mechanical Engineering', 'ME'),
+    ('Civil Engineering', 'CE'),
+    ('Instrumentation Engineering', 'IE'),
+]
+FIRST_NAMES = ['Anand', 'Arjun', 'Devika', 'Fathima', 'Gopika', 'Harikrishnan', 'Jishnu', 'Keerthana',
+               'Lakshmi', 'Muhammed', 'Nandana', 'Rahul', 'Sreelakshmi', 'Vishnu', 'Akhil', 'Aswathy']
+LAST_NAMES = ['K', 'P', 'M', 'Nair', 'Menon', 'Varghese', 'Thomas', 'Ali', 'Krishnan', 'Das', 'Raj', 'Babu']
+# admission numbers of seeded students start here; imported ones after them
+FIRST_ADMISSION_NUMBER = 100000
+BENCHMARKS = [
+    'import', 'all_students', 'pending_verification', 'verified_students', 'search', 'autocomplete',
+    'dashboard', 'tc_pending', 'tc_issued', 'tc_pdf', 'application_pdf', 'bulk_pdf', 'allocate',
+]
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database with synthetic students and TC applications, times the hot '
+            'paths and prints wall time, SQL queries and peak memory for each as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=20000)
+        parser.add_argument('--applications', type=int, default=5000)
+        parser.add_argument('--pending', type=int, default=200,
+                            help='How many of the applications are not issued yet (the bulk PDF prints these).')
+        parser.add_argument('--sessions', type=int, default=6, help='Academic years, ending with the current one.')
+        parser.add_argument('--import-rows', type=int, default=2000, help='Rows in each imported CSV.')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark.')
+        parser.add_argument('--only', default='', help='Comma separated benchmarks to run: {}.'.format(
+            ', '.join(BENCHMARKS)))
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON here instead of to stdout.')
+
+    def handle(self, *args, **options):
+        only = [name for name in options['only'].split(',') if name]
+        unknown = set(only) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError('Unknown benchmarks: {}'.format(', '.join(sorted(unknown))))
+        if options['pending'] > options['applications'] or options['applications'] > options['students']:
+            raise CommandError('Need --pending <= --applications <= --students.')
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.imported = 0
+
+        # everything happens in a fresh test database that is dropped afterwards
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        pdf_cache_dir = tempfile.mkdtemp()
+        metrics_dir = tempfile.mkdtemp()
+        try:
+            # metrics go to a throwaway file as well, so benchmarks never add to the real counters
+            with override_settings(TC_PDF_CACHE_DIR=pdf_cache_dir, STUDENT_IMPORT_BACKGROUND=False,
+                                   METRICS_DB=os.path.join(metrics_dir, 'metrics.sqlite3')):
+                started = time.perf_counter()
+                self.seed()
+                report = {
+                    'commit': self.commit(),
+                    'database': connection.vendor,
+                    'dataset': {
+                        'students': options['students'],
+                        'applications': options['applications'],
+                        'pending': options['pending'],
+                        'sessions': options['sessions'],
+                        'seed_seconds': round(time.perf_counter() - started, 2),
+                    },
+                    'repeat': options['repeat'],
+                    'results': self.run_benchmarks(only or BENCHMARKS, pdf_cache_dir),
+                }
+        finally:
+            # increments still buffered would be flushed to the real file later
+            metrics.discard()
+            shutil.rmtree(pdf_cache_dir, ignore_errors=True)
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def seed(self):
+        options = self.options
+        departments = Department.objects.bulk_create(Department(name=name, code=code) for name, code in DEPARTMENTS)
+        this_year = date.today().year
+        sessions = AcademicSession.objects.bulk_create(
+            AcademicSession(year=year) for year in range(this_year - options['sessions'] + 1, this_year + 1))
+        classrooms = Classroom.objects.bulk_create(
+            Classroom(department=department, semester=semester, academicyear=session)
+            for department in departments for semester in range(1, 7) for session in sessions)
+
+        students = Student.objects.bulk_create((self.student(i, departments) for i in range(options['students'])),
+                                               batch_size=1000)
+        through = Student.classroom.through
+        through.objects.bulk_create(
+            (through(student_id=student.pk, classroom_id=self.random.choice(classrooms).pk) for student in students),
+            batch_size=1000)
+
+        issued = options['applications'] - options['pending']
+        applications = []
+        for i, student in enumerate(self.random.sample(students, options['applications'])):
+            year = this_year - i % 3
+            applications.append(TcApplication(
+                student=student,
+                tc_application_Number=i // 3 + 1,
+                tc_application_Year=year,
+                tcNumber=i // 3 + 1 if i < issued else None,
+                tcYear=year if i < issued else None,
+                tc_issued=i < issued,
+                reasonforLeaving='Course Completed',
+                totalWorkingDay=78,
+                attendance=70,
+            ))
+        TcApplication.objects.bulk_create(applications, batch_size=1000)
+        self.user = User.objects.create_user('bench', password='bench', is_staff=True)
+
+    def student(self, i, departments):
+        return Student(
+            name='{} {}'.format(self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)),
+            admission_number=str(FIRST_ADMISSION_NUMBER + i),
+            department=self.random.choice(departments),
+            date_of_birth=date(2002, 1, 1) + timedelta(days=self.random.randrange(1500)),
+            date_of_join=date(2020, 8, 1),
+            guardian='Guardian {}'.format(i),
+            religion='Hindu',
+            community='Ezhava',
+            category='OBC',
+            active=self.random.random() < 0.8,
+            data_verified=self.random.random() < 0.7,
+        )
+
+    def import_csv(self):
+        rows = self.options['import_rows']
+        first = FIRST_ADMISSION_NUMBER + self.options['students'] + self.imported
+        self.imported += rows
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(list(COLUMNS))
+        join = date(2024, 8, 1).strftime(DATE_FORMAT)
+        for admission_number in range(first, first + rows):
+            writer.writerow([
+                '{} {}'.format(self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)),
+                date(2006, 1, 1).strftime(DATE_FORMAT), admission_number, 'Male', '', 'Guardian', 'father', '',
+                DEPARTMENTS[admission_number % len(DEPARTMENTS)][0], 'Hindu', 'Ezhava', 'OBC', join, 'No',
+            ])
+        return SimpleUploadedFile('bench.csv', out.getvalue().encode(), content_type='text/csv')
+
+    def run_benchmarks(self, names, pdf_cache_dir):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(self.user)
+        issued = TcApplication.objects.filter(tc_issued=True).order_by('id')
+        tc_student = issued.values_list('student_id', flat=True).first()
+        application_student = TcApplication.objects.filter(tc_issued=False).values_list('student_id', flat=True).first()
+        search_term = Student.objects.order_by('?').values_list('name', flat=True).first().split()[0]
+        year = date.today().year
+
+        def get(url):
+            def run():
+                response = client.get(url)
+                # stream bodies are produced while they are read
+                content = b''.join(response) if response.streaming else response.content
+                if response.status_code != 200:
+                    raise CommandError('{} returned {}'.format(url, response.status_code))
+                return content
+            return run
+
+        def clear_pdf_cache():
+            shutil.rmtree(pdf_cache_dir, ignore_errors=True)
+
+        benchmarks = {
+            # the importer itself: the view runs it on another thread, whose queries would not be counted
+            'import': (None, lambda: StudentImporter(on_conflict=settings.STUDENT_IMPORT_ON_CONFLICT).import_csv(
+                self.import_csv())),
+            'all_students': (None, get(reverse('students:allstudents'))),
+            'pending_verification': (None, get(reverse('students:students_pending_verification'))),
+            'verified_students': (None, get(reverse('students:verified_students'))),
+            'search': (None, get(reverse('students:allstudents') + '?a_number=' + search_term)),
+            'autocomplete': (None, get(reverse('students:student_autocomplete') + '?q=' + search_term[:4])),
+            'dashboard': (cache.clear, get(reverse('account:dashboard'))),
+            'tc_pending': (None, get(reverse('tc:all_tc'))),
+            'tc_issued': (None, get(reverse('tc:all_issued_tc'))),
+            'tc_pdf': (clear_pdf_cache, get(reverse('tc:tc_print_view', args=(tc_student,)))),
+            'application_pdf': (clear_pdf_cache, get(reverse('tc:application_view', args=(application_student,)))),
+            'bulk_pdf': (None, get(reverse('tc:printpendingapplications'))),
+            'allocate': (None, lambda: [numbering.allocate('tc', year) for i in range(100)]),
+        }
+        results = {}
+        for name in names:
+            setup, run = benchmarks[name]
+            results[name] = self.measure(setup, run)
+            self.stderr.write('{}: {:.1f} ms median, {} queries'.format(
+                name, results[name]['median_ms'], results[name]['queries']))
+        return results
+
+    def measure(self, setup, run):
+        """Times run() --repeat times after one untimed warm-up run, then once more under
+        tracemalloc for the peak memory.
+
+        setup (if given) runs before each run and is not timed, e.g. to empty a cache.
+        The warm-up starts worker pools and fills per-process caches such as the logo.
+        Queries and memory of worker processes (PDF rendering) are not counted.
+        """
+        if setup:
+            setup()
+        run()
+        times = []
+        for i in range(self.options['repeat']):
+            if setup:
+                setup()
+            # requests clear the query log when they start, which would throw the capture's start index off
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                run()
+                times.append((time.perf_counter() - started) * 1000)
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'wall_ms': [round(t, 2) for t in times],
+            'median_ms': round(statistics.median(times), 2),
+            'min_ms': round(min(times), 2),
+            # queries of the last run
+            'queries': len(queries),
+            'peak_kib': round(peak / 1024),
+        }
@@ -0,0 +1,240 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .sqlite_store import SQLiteStore
+
+# one row per sample; le is '' except on histogram buckets
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sample (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, le)
+) WITHOUT ROWID;
+'''
+ADD = ('INSERT INTO sample (name, labels, le, value) VALUES (?, ?, ?, ?) '
+       'ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value')
+# seconds
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+store = SimpleLazyObject(lambda: SQLiteStore(settings.METRICS_DB, SCHEMA))
+# every metric defined so far, by name
+registry = {}
+# this process's increments not yet added to store, by (name, labels, le)
+pending = {}
+lock = threading.Lock()
+# the process the flush thread was started in
+flusher_pid = None
+
+
+def add(samples):
+    """Adds (name, labels, le, value) samples to the totals every process shares.
+
+    They are only buffered here; flush() writes them, from a thread every
+    METRICS_FLUSH_INTERVAL seconds and before /metrics is answered, so
+    requests never wait on the shared file.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    with lock:
+        for name, labels, le, value in samples:
+            key = (name, labels, le)
+            pending[key] = pending.get(key, 0) + value
+    if flusher_pid != os.getpid():
+        start_flusher()
+
+
+def flush():
+    """Writes this process's buffered increments to the shared totals."""
+    with lock:
+        samples = [key + (value,) for key, value in pending.items()]
+        pending.clear()
+    if not samples:
+        return
+    try:
+        store.executemany(ADD, samples)
+    except sqlite3.Error:
+        # a locked or unwritable metrics file: try again with the next flush
+        add(samples)
+
+
+def discard():
+    with lock:
+        pending.clear()
+
+
+def start_flusher():
+    global flusher_pid
+    with lock:
+        if flusher_pid == os.getpid():
+            return
+        flusher_pid = os.getpid()
+    threading.Thread(target=flush_every, args=(settings.METRICS_FLUSH_INTERVAL,), name='metrics-flush',
+                     daemon=True).start()
+
+
+def flush_every(interval):
+    while True:
+        time.sleep(interval)
+        flush()
+
+
+def forget_parent():
+    # a forked child starts with a copy of its parent's buffer, which the parent will write itself
+    global lock
+    lock = threading.Lock()
+    pending.clear()
+
+
+os.register_at_fork(after_in_child=forget_parent)
+# what a worker stopping cleanly still had buffered; a killed one loses up to METRICS_FLUSH_INTERVAL of it
+atexit.register(flush)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry[name] = self
+
+    def label_text(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} takes the labels {}'.format(self.name, ', '.join(self.labelnames) or 'none'))
+        return ','.join('{}="{}"'.format(name, escape(labels[name])) for name in self.labelnames)
+
+
+class Counter(Metric):
+    """A running total, like prometheus_client's Counter but kept in METRICS_DB."""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        add([(self.name, self.label_text(labels), '', amount)])
+
+    def expose(self, samples):
+        for labels, value in sorted(samples.get((self.name, ''), {}).items()):
+            yield sample_line(self.name, labels, value)
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets, like prometheus_client's Histogram."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = [repr(float(bucket)) for bucket in buckets] + ['+Inf']
+        self.bounds = [float(bucket) for bucket in buckets]
+
+    def observe(self, value, **labels):
+        label_text = self.label_text(labels)
+        bucket = self.name + '_bucket'
+        samples = [(bucket, label_text, le, 1) for le, bound in zip(self.buckets, self.bounds) if value <= bound]
+        samples += [
+            (bucket, label_text, '+Inf', 1),
+            (self.name + '_sum', label_text, '', value),
+            (self.name + '_count', label_text, '', 1),
+        ]
+        add(samples)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def expose(self, samples):
+        counts = samples.get((self.name + '_count', ''), {})
+        sums = samples.get((self.name + '_sum', ''), {})
+        for labels in sorted(counts):
+            for le in self.buckets:
+                # buckets nothing fell into were never written
+                value = samples.get((self.name + '_bucket', le), {}).get(labels, 0)
+                yield sample_line(self.name + '_bucket', ','.join(filter(None, [labels, 'le="{}"'.format(le)])), value)
+            yield sample_line(self.name + '_sum', labels, sums.get(labels, 0))
+            yield sample_line(self.name + '_count', labels, counts[labels])
+
+
+def sample_line(name, labels, value):
+    if labels:
+        return '{}{{{}}} {}'.format(name, labels, format_value(value))
+    return '{} {}'.format(name, format_value(value))
+
+
+def exposition():
+    """Every registered metric in the Prometheus text format, totalled over all processes.
+
+    Other processes' latest increments show up once their next flush is due.
+    """
+    flush()
+    samples = {}
+    for row in store.query('SELECT name, labels, le, value FROM sample'):
+        samples.setdefault((row['name'], row['le']), {})[row['labels']] = row['value']
+    lines = []
+    for name in sorted(registry):
+        metric = registry[name]
+        lines.append('# HELP {} {}'.format(name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(name, metric.type))
+        lines.extend(metric.expose(samples))
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_SECONDS = Histogram('services_request_duration_seconds', 'Time taken by views to return a response.',
+                            ['view'])
+
+
+class MetricsMiddleware:
+    """Observes REQUEST_SECONDS for every request that resolved to a view.
+
+    Streaming responses are timed up to the point the view returns them,
+    before their content is produced. Observing only adds to this process's
+    buffer, so it is done in line, under ASGI too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, seconds):
+        match = request.resolver_match
+        # unresolved paths (404s) would add a label value per path
+        if match is not None:
+            REQUEST_SECONDS.observe(seconds, view=match.view_name)
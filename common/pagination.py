@@ -0,0 +1,86 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+# cursor values outside a 64-bit integer column could only come from an edited URL
+LARGEST_KEY = 2 ** 63 - 1
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Seek pagination over a unique ordering such as ['-tcYear', '-tcNumber', '-id'].
+
+    Pages are fetched with a WHERE on the last (or first) row's key instead of
+    an OFFSET, so every page costs the same as the first one. Cursors are the
+    key values of that row joined with dots. The keys must be integers; rows
+    with a NULL key are left out, as they have no place in the order to seek
+    from. A cursor that does not parse is treated as none.
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        self.queryset = queryset.filter(**{key.lstrip('-') + '__isnull': False for key in ordering})
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def get_page(self, after=None, before=None):
+        before = self.parse_cursor(before)
+        after = self.parse_cursor(after)
+        if before:
+            ordering = [key[1:] if key.startswith('-') else '-' + key for key in self.ordering]
+            rows = list(self.queryset.filter(self.seek(ordering, before)).order_by(*ordering)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(rows, self.cursor(rows[-1]) if rows else None,
+                              self.cursor(rows[0]) if more else None)
+        queryset = self.queryset.order_by(*self.ordering)
+        if after:
+            queryset = queryset.filter(self.seek(self.ordering, after))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(rows, self.cursor(rows[-1]) if more else None,
+                          self.cursor(rows[0]) if after and rows else None)
+
+    def parse_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            values = [int(value) for value in cursor.split('.')]
+        except ValueError:
+            return None
+        if len(values) != len(self.ordering) or any(abs(value) > LARGEST_KEY for value in values):
+            return None
+        return values
+
+    def cursor(self, row):
+        return '.'.join(str(getattr(row, key.lstrip('-'))) for key in self.ordering)
+
+    def seek(self, ordering, values):
+        # rows that sort after `values`: (a, b) > (x, y) is a > x OR (a = x AND b > y)
+        clauses = []
+        equal = {}
+        for key, value in zip(ordering, values):
+            field = key.lstrip('-')
+            lookup = '{}__{}'.format(field, 'lt' if key.startswith('-') else 'gt')
+            clauses.append(Q(**equal, **{lookup: value}))
+            equal[field] = value
+        return reduce(or_, clauses)
@@ -0,0 +1,242 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject
+
+from .sqlite_store import SQLiteStore
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS request (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    view TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    wall_ms REAL NOT NULL,
+    sql_count INTEGER NOT NULL,
+    sql_ms REAL NOT NULL,
+    pdf_ms REAL NOT NULL,
+    heavy_ms REAL NOT NULL,
+    capture TEXT,
+    capture_output TEXT
+);
+CREATE INDEX IF NOT EXISTS request_view_idx ON request (view);
+CREATE TABLE IF NOT EXISTS query (
+    request_id INTEGER NOT NULL,
+    sql TEXT NOT NULL,
+    ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS query_request_idx ON query (request_id);
+'''
+CAPTURES = ('cprofile', 'tracemalloc')
+# ?_profile=cprofile or the X-Profile: cprofile header, staff only
+CAPTURE_PARAMETER = '_profile'
+CAPTURE_HEADER = 'HTTP_X_PROFILE'
+
+store = SimpleLazyObject(lambda: SQLiteStore(settings.PROFILING_DB, SCHEMA))
+current = ContextVar('profiling_record', default=None)
+
+
+class Record:
+    def __init__(self, request):
+        self.request = request
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.queries = []
+        # milliseconds per timed() section, and the sections currently running
+        self.sections = {}
+        self.active = set()
+        self.capture = None
+        self.capture_output = None
+
+    def add_query(self, sql, ms):
+        self.sql_count += 1
+        self.sql_ms += ms
+        self.queries.append((ms, sql))
+
+    def save(self, response):
+        wall_ms = (time.perf_counter() - self.clock) * 1000
+        match = self.request.resolver_match
+        view = match.view_name if match else ''
+        db = store.connect()
+        cursor = db.execute(
+            'INSERT INTO request (started, method, path, view, status, wall_ms, sql_count, sql_ms, pdf_ms, '
+            'heavy_ms, capture, capture_output) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.started, self.request.method, self.request.path, view or self.request.path, response.status_code,
+             wall_ms, self.sql_count, self.sql_ms, self.sections.get('pdf', 0.0),
+             sum(ms for section, ms in self.sections.items() if section.startswith('heavy:')),
+             self.capture, self.capture_output))
+        request_id = cursor.lastrowid
+        slowest = sorted(self.queries, reverse=True)[:settings.PROFILING_QUERIES_PER_REQUEST]
+        db.executemany('INSERT INTO query (request_id, sql, ms) VALUES (?, ?, ?)',
+                       [(request_id, sql, ms) for ms, sql in slowest])
+        # rolling: only the latest PROFILING_MAX_REQUESTS requests are kept
+        oldest = request_id - settings.PROFILING_MAX_REQUESTS
+        if oldest > 0:
+            db.execute('DELETE FROM request WHERE id <= ?', (oldest,))
+            db.execute('DELETE FROM query WHERE request_id <= ?', (oldest,))
+
+
+@contextmanager
+def timed(section):
+    """Adds the time spent in the block to the current request's record under section.
+
+    Nested blocks of the same section are counted once. Does nothing outside
+    a profiled request.
+    """
+    record = current.get()
+    if record is None or section in record.active:
+        yield
+        return
+    record.active.add(section)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.active.discard(section)
+        record.sections[section] = record.sections.get(section, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def record_query(execute, sql, params, many, context):
+    record = current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.add_query(sql, (time.perf_counter() - started) * 1000)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    # on every connection instead of connection.execute_wrapper() around the request, so queries
+    # run by sync_to_async threads for async views are counted too
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ProfilingMiddleware:
+    """Records wall time, SQL and PDF rendering time of every request in PROFILING_DB.
+
+    Opt in with PROFILING_ENABLED. Staff can also ask for a cProfile or
+    tracemalloc capture of one request with ?_profile=cprofile (or
+    tracemalloc) or the same value in an X-Profile header. Both captures
+    cover the thread the request runs in, so for async views they show the
+    event loop rather than the executors the work is handed to.
+    Streaming responses are recorded once their content has been sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        connection_created.connect(install_query_wrapper, dispatch_uid='profiling_query_wrapper')
+        for connection in connections.all(initialized_only=True):
+            install_query_wrapper(None, connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        record = Record(request)
+        token = current.set(record)
+        try:
+            with self.capture(record):
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(record, response)
+
+    async def __acall__(self, request):
+        record = Record(request)
+        token = current.set(record)
+        try:
+            capture = await sync_to_async(self.capture)(record)
+            with capture:
+                response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        if response.streaming and not response.is_async:
+            return self.finish(record, response)
+        await sync_to_async(record.save, thread_sensitive=False)(response)
+        return response
+
+    def finish(self, record, response):
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.stream(record, response, response.streaming_content)
+        else:
+            record.save(response)
+        return response
+
+    def stream(self, record, response, content):
+        # the content is produced while it is sent, after the middleware has returned
+        content = iter(content)
+        try:
+            while True:
+                token = current.set(record)
+                try:
+                    chunk = next(content)
+                except StopIteration:
+                    return
+                finally:
+                    current.reset(token)
+                yield chunk
+        finally:
+            record.save(response)
+
+    def capture(self, record):
+        kind = record.request.GET.get(CAPTURE_PARAMETER) or record.request.META.get(CAPTURE_HEADER)
+        if kind not in CAPTURES or not record.request.user.is_staff:
+            return nullcapture()
+        record.capture = kind
+        return profile(record) if kind == 'cprofile' else trace_memory(record)
+
+
+@contextmanager
+def nullcapture():
+    yield
+
+
+@contextmanager
+def profile(record):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(60)
+        record.capture_output = out.getvalue()
+
+
+@contextmanager
+def trace_memory(record):
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        peak = tracemalloc.get_traced_memory()[1]
+        stats = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+        if not already_tracing:
+            tracemalloc.stop()
+        lines = ['peak {:.0f} KiB'.format(peak / 1024)]
+        lines += [str(stat) for stat in stats[:40]]
+        record.capture_output = '\n'.join(lines)
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import threading
+import time
+
+# seconds a connection waits on another process's lock
+TIMEOUT = 5
+
+
+class SQLiteStore:
+    """A small sqlite database kept apart from DATABASES, shared by every worker process on the host.
+
+    Used for diagnostics, so writing to it never touches the application
+    database, its transactions or its query log. Each thread gets its own
+    connection, and so does each forked process; the schema is created on
+    first use.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.local = threading.local()
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        # a connection must not be used on both sides of a fork
+        if db is None or self.local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=TIMEOUT, isolation_level=None)
+            try:
+                self.setup(db)
+            except BaseException:
+                db.close()
+                raise
+            self.local.db = db
+            self.local.pid = os.getpid()
+        return db
+
+    def setup(self, db):
+        db.row_factory = sqlite3.Row
+        # readers do not block the writing workers. Switching a new database to
+        # WAL fails at once, without waiting out the timeout, while another
+        # process is doing the same, so workers starting together retry
+        deadline = time.monotonic() + TIMEOUT
+        while True:
+            try:
+                db.execute('PRAGMA journal_mode=WAL')
+                break
+            except sqlite3.OperationalError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(.05)
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.executescript(self.schema)
+
+    def execute(self, sql, params=()):
+        return self.connect().execute(sql, params)
+
+    def query(self, sql, params=()):
+        return self.execute(sql, params).fetchall()
+
+    def executemany(self, sql, rows):
+        """Runs sql for every row in one transaction."""
+        db = self.connect()
+        db.execute('BEGIN')
+        try:
+            db.executemany(sql, rows)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
@@ -1,3 +1,304 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from datetime import date
+from xml.etree import ElementTree
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import metrics
+from .checks import log_startup_checks
+from .exports import csv_chunks, xlsx_chunks
+from .executors import ExecutorBusy, run_heavy
+from .profiling import SCHEMA
+from .sqlite_store import SQLiteStore
+
+
+class StartupChecksTest(SimpleTestCase):
+
+    @override_settings(SETTINGS_PROFILE='production', DEBUG=True)
+    def test_production_warnings_are_logged(self):
+        with self.assertLogs('common.checks', 'WARNING') as logs:
+            log_startup_checks()
+        self.assertTrue(any('common.W001' in line for line in logs.output))
+
+    @override_settings(SETTINGS_PROFILE='development', DEBUG=True)
+    def test_development_runs_no_checks(self):
+        with self.assertNoLogs('common.checks'):
+            log_startup_checks()
+
+
+class StaticFilesTest(SimpleTestCase):
+
+    def test_served_without_collectstatic(self):
+        response = self.client.get('/static/images/poly-logo-2.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+
+@override_settings(HEAVY_WORK_EXECUTORS={'test-busy': ('thread', 1, 2)})
+class RunHeavyTest(SimpleTestCase):
+
+    async def test_refuses_work_beyond_the_queue_limit(self):
+        release = threading.Event()
+        # one job running and one waiting fill the queue
+        running = run_heavy('test-busy', release.wait, 5)
+        waiting = run_heavy('test-busy', pow, 2, 10)
+        tasks = [asyncio.ensure_future(running), asyncio.ensure_future(waiting)]
+        await asyncio.sleep(0)
+        with self.assertRaises(ExecutorBusy):
+            await run_heavy('test-busy', pow, 2, 3)
+        release.set()
+        self.assertEqual(await asyncio.gather(*tasks), [True, 1024])
+        # finished jobs give their slots back
+        self.assertEqual(await run_heavy('test-busy', pow, 2, 3), 8)
+
+
+def with_profiling(middleware):
+    # where settings.py puts it when PROFILING_ENABLED is on
+    middleware = list(middleware)
+    middleware.insert(middleware.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+                      'common.profiling.ProfilingMiddleware')
+    return middleware
+
+
+@override_settings(MIDDLEWARE=with_profiling(settings.MIDDLEWARE))
+class ProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = SQLiteStore(os.path.join(directory.name, 'profiling.sqlite3'), SCHEMA)
+        for target in ('common.profiling.store', 'common.views.store'):
+            patcher = mock.patch(target, self.store)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.clerk = User.objects.create_user('clerk')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+
+    def last_request(self):
+        return self.store.query('SELECT * FROM request ORDER BY id DESC LIMIT 1')[0]
+
+    def test_records_the_queries_of_a_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('tc:all_issued_tc'))
+        record = self.last_request()
+        self.assertEqual((record['view'], record['status'], record['method']), ('tc:all_issued_tc', 200, 'GET'))
+        self.assertEqual(record['sql_count'], len(queries))
+        self.assertGreater(record['wall_ms'], 0)
+        stored = self.store.query('SELECT sql FROM query WHERE request_id = ?', (record['id'],))
+        self.assertEqual(len(stored), min(len(queries), settings.PROFILING_QUERIES_PER_REQUEST))
+        self.assertTrue(all(row['sql'] in [query['sql'] for query in queries.captured_queries] for row in stored))
+
+    def test_captures_are_for_staff_only(self):
+        for user, expected in ((None, None), (self.clerk, None), (self.staff, 'cprofile')):
+            if user:
+                self.client.force_login(user)
+            self.client.get(reverse('tc:all_issued_tc'), {'_profile': 'cprofile'})
+            record = self.last_request()
+            self.assertEqual(record['capture'], expected, user)
+        self.assertIn('function calls', record['capture_output'])
+        self.client.get(reverse('tc:all_issued_tc'), HTTP_X_PROFILE='tracemalloc')
+        self.assertTrue(self.last_request()['capture_output'].startswith('peak'))
+
+    def test_report_is_for_staff_only(self):
+        self.client.get(reverse('tc:all_issued_tc'))
+        self.client.force_login(self.clerk)
+        self.assertEqual(self.client.get(reverse('profiling')).status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('profiling')).status_code, 200)
+        response = self.client.get(reverse('profiling_detail', args=(self.last_request()['id'] - 1,)))
+        self.assertEqual(response.status_code, 200)
+
+
+def observe_many(histogram, counter, values):
+    for value in values:
+        histogram.observe(value, view='list')
+        counter.inc(kind='tc')
+    # a worker's flush thread would do this later
+    metrics.flush()
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch('common.metrics.store', SQLiteStore(os.path.join(directory.name, 'metrics.sqlite3'),
+                                                                 metrics.SCHEMA))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        registry = mock.patch.dict(metrics.registry, clear=True)
+        registry.start()
+        self.addCleanup(registry.stop)
+        # flushes are called by the tests rather than a thread
+        for patcher in (mock.patch('common.metrics.start_flusher'), mock.patch.dict(metrics.pending, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.histogram = metrics.Histogram('test_seconds', 'Time taken.', ['view'], buckets=(.1, 1))
+        self.counter = metrics.Counter('test_total', 'Things done.', ['kind'])
+
+    def test_exposition(self):
+        self.counter.inc(kind='say "hi"\n')
+        self.counter.inc(2, kind='tc')
+        self.histogram.observe(.05, view='list')
+        self.histogram.observe(.5, view='list')
+        self.assertEqual(metrics.exposition(), '\n'.join([
+            '# HELP test_seconds Time taken.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="list",le="0.1"} 1',
+            'test_seconds_bucket{view="list",le="1.0"} 2',
+            'test_seconds_bucket{view="list",le="+Inf"} 2',
+            'test_seconds_sum{view="list"} 0.55',
+            'test_seconds_count{view="list"} 2',
+            '# HELP test_total Things done.',
+            '# TYPE test_total counter',
+            'test_total{kind="say \\"hi\\"\\n"} 1',
+            'test_total{kind="tc"} 2',
+        ]) + '\n')
+
+    def stored(self):
+        return metrics.store.query('SELECT value FROM sample WHERE name = ?', ('test_total',))
+
+    def test_increments_are_buffered_until_flushed(self):
+        self.counter.inc(kind='tc')
+        self.counter.inc(2, kind='tc')
+        self.assertEqual(self.stored(), [])
+        metrics.flush()
+        self.assertEqual([row['value'] for row in self.stored()], [3])
+        self.assertEqual(metrics.pending, {})
+
+    def test_failed_flush_keeps_the_increments(self):
+        self.counter.inc(kind='tc')
+        with mock.patch.object(metrics.store, 'executemany', side_effect=sqlite3.OperationalError('locked')):
+            metrics.flush()
+        self.assertEqual(metrics.pending, {('test_total', 'kind="tc"', ''): 1})
+        metrics.flush()
+        self.assertEqual([row['value'] for row in self.stored()], [1])
+
+    def test_middleware_times_resolved_requests(self):
+        request_seconds = metrics.Histogram('services_request_duration_seconds', 'Time taken.', ['view'])
+        with mock.patch.object(metrics, 'REQUEST_SECONDS', request_seconds):
+            for view_name in ('sync', None):
+                request = RequestFactory().get('/')
+                request.resolver_match = mock.Mock(view_name=view_name) if view_name else None
+                metrics.MetricsMiddleware(lambda request: HttpResponse())(request)
+
+            async def get_response(request):
+                return HttpResponse()
+            request = RequestFactory().get('/')
+            request.resolver_match = mock.Mock(view_name='async')
+            asyncio.run(metrics.MetricsMiddleware(get_response)(request))
+        self.assertEqual(metrics.store.query('SELECT * FROM sample'), [])
+        # nothing for the request that did not resolve
+        self.assertEqual([line for line in metrics.exposition().splitlines() if '_count' in line], [
+            'services_request_duration_seconds_count{view="async"} 1',
+            'services_request_duration_seconds_count{view="sync"} 1',
+        ])
+
+    def test_totals_cover_every_process(self):
+        # still buffered when the workers fork: they must not write it again
+        self.histogram.observe(.5, view='list')
+        self.counter.inc(kind='tc')
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=observe_many, args=(self.histogram, self.counter, [.0625, 2] * 5))
+                     for i in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+            self.assertEqual(process.exitcode, 0)
+        lines = metrics.exposition().splitlines()
+        self.assertIn('test_seconds_bucket{view="list",le="0.1"} 15', lines)
+        self.assertIn('test_seconds_bucket{view="list",le="1.0"} 16', lines)
+        self.assertIn('test_seconds_bucket{view="list",le="+Inf"} 31', lines)
+        self.assertIn('test_seconds_sum{view="list"} 31.4375', lines)
+        self.assertIn('test_seconds_count{view="list"} 31', lines)
+        self.assertIn('test_total{kind="tc"} 31', lines)
+
+    def test_endpoint_is_for_allowed_addresses_and_staff(self):
+        self.counter.inc(kind='tc')
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'test_total{kind="tc"} 1', response.content)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9').status_code, 403)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9').status_code, 200)
+
+
+SHEET = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def read_xlsx(data):
+    """The rows of the first sheet, as (cell reference, style, text) per cell."""
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook:
+        # CRC and size of every member, including the streamed sheet's data descriptor
+        assert workbook.testzip() is None
+        for name in ('[Content_Types].xml', '_rels/.rels', 'xl/workbook.xml', 'xl/styles.xml'):
+            ElementTree.fromstring(workbook.read(name))
+        sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+    return [[(cell.get('r'), cell.get('s'), ''.join(cell.itertext()))
+             for cell in row.iter(SHEET + 'c')] for row in sheet.iter(SHEET + 'row')]
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportFormatTest(SimpleTestCase):
+    header = ['Name', 'Joined', 'Active', 'Marks']
+    rows = [
+        ('Anu, "A" <&>', date(2021, 8, 1), True, 7),
+        ('Line\nbreak\x0b', None, False, 2.5),
+        ('=1+1', date(1900, 3, 1), None, 0),
+    ]
+
+    def test_csv(self):
+        chunks = list(csv_chunks(self.header, self.rows))
+        # a chunk per EXPORT_CHUNK_SIZE rows
+        self.assertEqual(len(chunks), 2)
+        text = b''.join(chunks).decode()
+        self.assertTrue(text.startswith('\ufeff'))
+        self.assertEqual(list(csv.reader(io.StringIO(text[1:]))), [
+            self.header,
+            ['Anu, "A" <&>', '01/08/2021', 'Yes', '7'],
+            ['Line\nbreak\x0b', '', 'No', '2.5'],
+            ["'=1+1", '01/03/1900', '', '0'],
+        ])
+
+    def test_csv_cells_cannot_be_formulas(self):
+        values = ['=HYPERLINK("http://x")', '+91 98470', '-2+3', '@SUM(A1)', '\tcmd', 'Anu = Anu', -5, 2.5]
+        text = b''.join(csv_chunks(['Value'] * len(values), [values])).decode()
+        self.assertEqual(list(csv.reader(io.StringIO(text[1:])))[1], [
+            '\'=HYPERLINK("http://x")', "'+91 98470", "'-2+3", "'@SUM(A1)", "'\tcmd", 'Anu = Anu', '-5', '2.5'])
+
+    def test_csv_without_rows_is_the_header(self):
+        self.assertEqual(b''.join(csv_chunks(self.header, [])).decode(), '\ufeffName,Joined,Active,Marks\r\n')
+
+    def test_xlsx(self):
+        rows = read_xlsx(b''.join(xlsx_chunks(self.header, self.rows, sheet_name='A & "B"')))
+        self.assertEqual([[text for ref, style, text in row] for row in rows], [
+            self.header,
+            ['Anu, "A" <&>', '44409', 'Yes', '7'],
+            # characters XML cannot hold are dropped
+            ['Line\nbreak', '', 'No', '2.5'],
+            ['=1+1', '61', '', '0'],
+        ])
+        self.assertEqual(rows[1][1], ('B2', '1', '44409'))
+        self.assertEqual([ref for ref, style, text in rows[3]], ['A4', 'B4', 'C4', 'D4'])
+
+    def test_xlsx_without_rows_is_a_valid_workbook(self):
+        self.assertEqual(read_xlsx(b''.join(xlsx_chunks(self.header, []))), [
+            [('A1', None, 'Name'), ('B1', None, 'Joined'), ('C1', None, 'Active'), ('D1', None, 'Marks')]])
@@ -1,3 +1,50 @@
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
-# Create your views here.
+from . import metrics as prometheus
+from .profiling import store
+
+# rows shown in each table of the profiling report
+PROFILING_REPORT_ROWS = 50
+
+
+@staff_member_required
+def profiling_report(request):
+    context = admin.site.each_context(request)
+    context.update(title='Request profiling', enabled=settings.PROFILING_ENABLED)
+    context['endpoints'] = store.query(
+        'SELECT view, COUNT(*) AS requests, AVG(wall_ms) AS avg_ms, MAX(wall_ms) AS max_ms, '
+        'AVG(sql_count) AS avg_sql_count, AVG(sql_ms) AS avg_sql_ms, AVG(pdf_ms) AS avg_pdf_ms, '
+        'AVG(heavy_ms) AS avg_heavy_ms FROM request GROUP BY view ORDER BY avg_ms DESC LIMIT ?',
+        (PROFILING_REPORT_ROWS,))
+    context['requests'] = store.query(
+        'SELECT * FROM request ORDER BY wall_ms DESC LIMIT ?', (PROFILING_REPORT_ROWS,))
+    context['queries'] = store.query(
+        'SELECT sql, COUNT(*) AS runs, AVG(ms) AS avg_ms, MAX(ms) AS max_ms, SUM(ms) AS total_ms '
+        'FROM query GROUP BY sql ORDER BY total_ms DESC LIMIT ?', (PROFILING_REPORT_ROWS,))
+    context['captures'] = store.query(
+        'SELECT id, started, method, path, capture, wall_ms FROM request WHERE capture IS NOT NULL '
+        'ORDER BY id DESC LIMIT ?', (PROFILING_REPORT_ROWS,))
+    return render(request, 'common/profiling.html', context)
+
+
+@staff_member_required
+def profiling_detail(request, pk):
+    rows = store.query('SELECT * FROM request WHERE id = ?', (pk,))
+    if not rows:
+        raise Http404('No such profiled request')
+    context = admin.site.each_context(request)
+    context.update(title='Profiled request', record=rows[0], queries=store.query(
+        'SELECT sql, ms FROM query WHERE request_id = ? ORDER BY ms DESC', (pk,)))
+    return render(request, 'common/profiling_detail.html', context)
+
+
+def metrics(request):
+    # scraped without logging in, so only from METRICS_ALLOWED_IPS unless a staff member is looking
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(prometheus.exposition(), content_type=prometheus.CONTENT_TYPE)
@@ -34,8 +34,13 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 #SECRET_KEY = 'd3kavfz(*0#66o+3*g!aa(7bv!c7$gzi-#)1@h%qwqtjoe%soj'
 SECRET_KEY = env('SECRET_KEY')
 
+# 'development' or 'production'; production turns on the caching and connection settings below
+SETTINGS_PROFILE = env('SETTINGS_PROFILE', default='development')
+PRODUCTION = SETTINGS_PROFILE == 'production'
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DEBUG also keeps every SQL query of a request in memory
+DEBUG = env.bool('DEBUG', default=not PRODUCTION)
 
 ALLOWED_HOSTS = ["service.gptcpalakkad.ac.in","127.0.0.1","localhost"]
 
@@ -53,6 +58,8 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    # static files are served by WhiteNoise under runserver too
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
      'widget_tweaks',
      'common',
@@ -62,6 +69,8 @@ INSTALLED_APPS = [
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # WhiteNoise's middleware, usable without the rest of the stack going sync under ASGI
+    'common.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,6 +78,9 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if PRODUCTION:
+    # before anything else that reads or changes the response body
+    MIDDLEWARE.insert(2, 'django.middleware.gzip.GZipMiddleware')
 
 ROOT_URLCONF = 'services.urls'
 
@@ -88,6 +100,16 @@ TEMPLATES = [
     },
 ]
 
+if PRODUCTION:
+    # templates are compiled once per process instead of re-read and parsed on every render
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'services.wsgi.application'
 
 
@@ -114,6 +136,12 @@ WSGI_APPLICATION = 'services.wsgi.application'
 DATABASES = {
     'default': env.db(),
 }
+# keep connections open between requests in production, checking they still work before reuse
+DATABASES['default'].setdefault('CONN_MAX_AGE', env.int('CONN_MAX_AGE', default=600 if PRODUCTION else 0))
+DATABASES['default'].setdefault('CONN_HEALTH_CHECKS', PRODUCTION)
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # an in-memory test database cannot be shared with the threads and processes of the tc numbering tests
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', os.path.join(BASE_DIR, 'test_db.sqlite3'))
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -156,8 +184,84 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static')
 ]
+if PRODUCTION:
+    # collectstatic writes content-hashed copies plus .gz and .br variants of each file;
+    # WhiteNoise serves the hashed names with a far-future immutable Cache-Control
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+    }
+else:
+    # development and tests serve static/ and the apps' files as they are, without collectstatic;
+    # WhiteNoise otherwise expects STATIC_ROOT whenever DEBUG is off, as it is under the test runner
+    WHITENOISE_USE_FINDERS = True
+    WHITENOISE_AUTOREFRESH = True
 # login/register redirects
 LOGIN_REDIRECT_URL = 'account:dashboard'
 LOGOUT_REDIRECT_URL = 'account:login'
 LOGIN_URL = 'account:login'
-LOGOUT_URL = 'account:logout'
\ No newline at end of file
+LOGOUT_URL = 'account:logout'
+
+# student import: rows per bulk_create batch, and 'skip' or 'update' for admission numbers already present
+STUDENT_IMPORT_BATCH_SIZE = 500
+STUDENT_IMPORT_ON_CONFLICT = 'skip'
+# queue uploads for `manage.py importworker` instead of importing inside the request
+STUDENT_IMPORT_BACKGROUND = True
+# seconds a running import may go without finishing a batch before the worker marks it failed
+STUDENT_IMPORT_STALE_AFTER = 600
+
+# bulk TC/application printing: 'pdf' executor workers one print keeps busy (1 renders in the request's own thread)
+# and applications rendered per worker task
+TC_RENDER_WORKERS = 2
+TC_RENDER_CHUNK_SIZE = 50
+# pools async views hand CPU-heavy work to, apart from the thread synchronous views run in under ASGI:
+# name: ('process' or 'thread', workers, most jobs running or waiting before requests get a 503).
+# imports write to the database as they parse, so they run in threads
+HEAVY_WORK_EXECUTORS = {
+    'pdf': ('process', os.cpu_count() or 1, 16),
+    'import': ('thread', 1, 4),
+}
+# watermark drawn on every TC/application page
+TC_LOGO_PATH = env('TC_LOGO_PATH', default=os.path.join(BASE_DIR, 'static', 'images', 'poly-logo-2.png'))
+
+# rendered TC/application PDFs kept for reprints, least recently used removed first
+TC_PDF_CACHE_DIR = os.path.join(BASE_DIR, 'pdfcache')
+TC_PDF_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# LocMemCache by default in development, which is per process; production defaults to a file
+# cache shared by all workers. Point CACHE_URL at redis:// or memcache:// where there is one
+CACHES = {
+    'default': env.cache('CACHE_URL', default=('filecache://' + os.path.join(BASE_DIR, 'cache')) if PRODUCTION else 'locmemcache://'),
+}
+if PRODUCTION:
+    # sessions read from the cache, written through to the database
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# dashboard counts are cleared on every student/application change; the timeout
+# only bounds how stale another process's copy can get
+DASHBOARD_COUNTS_TIMEOUT = 300
+
+# per-request wall time, SQL and PDF timing kept in a sqlite file apart from the main database,
+# shown at admin/profiling/. Opt in: it adds a small write to every request
+PROFILING_ENABLED = env.bool('PROFILING_ENABLED', default=False)
+PROFILING_DB = os.path.join(BASE_DIR, 'profiling', 'profiling.sqlite3')
+# requests kept, oldest dropped first, and the slowest queries kept of each
+PROFILING_MAX_REQUESTS = 10000
+PROFILING_QUERIES_PER_REQUEST = 10
+if PROFILING_ENABLED:
+    # after authentication, which decides who may ask for a cProfile/tracemalloc capture
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+                      'common.profiling.ProfilingMiddleware')
+
+# rows fetched per query, and written per chunk, by the streaming CSV/XLSX exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Prometheus counters and histograms at /metrics, totalled across worker processes in a shared sqlite file
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=PRODUCTION)
+METRICS_DB = os.path.join(BASE_DIR, 'metrics', 'metrics.sqlite3')
+# seconds each process buffers its increments before adding them to METRICS_DB, off the request path
+METRICS_FLUSH_INTERVAL = 10
+# who may read /metrics without logging in as staff
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(MIDDLEWARE.index('common.middleware.AsyncWhiteNoiseMiddleware') + 1,
+                      'common.metrics.MetricsMiddleware')
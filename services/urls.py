@@ -20,6 +20,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from account.views import dashboard
+from common.views import metrics, profiling_detail, profiling_report
 
 
 admin.site.site_header = "GPC Palakkad"
@@ -28,11 +29,14 @@ admin.site.index_title = "Welcome to GPC Palakkad Portal"
 
 
 urlpatterns = [
+    path('admin/profiling/', profiling_report, name='profiling'),
+    path('admin/profiling/<int:pk>/', profiling_detail, name='profiling_detail'),
     path('admin/', admin.site.urls),
     path('students/', include('students.urls', namespace='students')),
     path('account/', include('account.urls')),
     path('tc/', include('tc.urls')),
     path('', dashboard, name='index_view'),
+    path('metrics', metrics, name='metrics'),
     path('', include('students.urls')),
     path('password-reset/',
         auth_views.PasswordResetView.as_view(
@@ -64,5 +68,4 @@ urlpatterns = [
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL,
-                          document_root=settings.STATIC_ROOT)
+    # static files are served by WhiteNoise
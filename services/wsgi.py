@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'services.settings')
 
 application = get_wsgi_application()
+
+# the server does not run the system checks manage.py does
+from common.checks import log_startup_checks  # noqa: E402
+
+log_startup_checks()
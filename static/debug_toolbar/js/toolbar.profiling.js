@@ -1,3 +0,0 @@
-(function () {
-    djdt.applyStyle('padding-left');
-})();
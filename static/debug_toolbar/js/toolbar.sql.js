@@ -1,5 +0,0 @@
-(function () {
-    djdt.applyStyle('background-color');
-    djdt.applyStyle('left');
-    djdt.applyStyle('width');
-})();
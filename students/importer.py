@@ -0,0 +1,289 @@
+import csv
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from contextlib import nullcontext
+from io import TextIOWrapper
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from account.counters import invalidate_dashboard_counts
+from admin_tools.models import Department
+from common.metrics import Counter
+from .listing import bump_list_generation
+from .models import ImportJob, Student
+
+# column in the admission register export -> Student field
+COLUMNS = {
+    'Name': 'name',
+    'Date  of Birth': 'date_of_birth',
+    'Adm No.': 'admission_number',
+    'Gender': 'gender',
+    'Mobile': 'mobile',
+    'guardian': 'guardian',
+    'Relashionship with guardian': 'guardian_relation',
+    'address': 'address',
+    'Branch of Study': 'department',
+    'Religion': 'religion',
+    'Caste': 'community',
+    'Category': 'category',
+    'Date ofJoin': 'date_of_join',
+    'Whether in receipt of fee concession': 'feeconcession',
+}
+DATE_FORMAT = '%d-%m-%Y'
+# fields written again when an existing admission number is imported with on_conflict='update'
+UPDATE_FIELDS = [field for field in COLUMNS.values() if field != 'admission_number']
+# imported text checked against its column: max_length, and for choice fields a stored value matched case insensitively
+CHECKED_FIELDS = ['name', 'gender', 'mobile', 'guardian', 'guardian_relation', 'religion', 'community', 'category']
+CHOICES = {
+    field: {str(value).lower(): value for value, label in Student._meta.get_field(field).choices}
+    for field in CHECKED_FIELDS if Student._meta.get_field(field).choices
+}
+IMPORT_ROWS = Counter('services_import_rows_total',
+                      'Student import rows processed, by result (created, updated, skipped or rejected).', ['result'])
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    try:
+        return datetime.strptime(value, DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected = []
+        self.elapsed = 0.0
+
+    @property
+    def rows(self):
+        return self.created + self.updated + self.skipped + len(self.rejected)
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.rows / self.elapsed
+
+    def reject(self, row, admission_number, reason):
+        self.rejected.append({'row': row, 'admission_number': admission_number, 'reason': reason})
+
+    def __str__(self):
+        return '{} rows: {} created, {} updated, {} skipped, {} rejected ({:.0f} rows/s)'.format(
+            self.rows, self.created, self.updated, self.skipped, len(self.rejected), self.rows_per_second)
+
+
+class StudentImporter:
+    """Imports students in bulk_create batches.
+
+    on_conflict decides what happens to admission numbers that already exist:
+    'skip' leaves the stored student untouched, 'update' overwrites it with the
+    imported values. By default the whole import is one transaction; with
+    single_transaction=False every batch is committed on its own, so progress
+    is visible to other connections while the import runs. progress, if given,
+    is called with the running ImportResult after each batch.
+    """
+
+    def __init__(self, batch_size=None, on_conflict='skip', single_transaction=True, progress=None):
+        if on_conflict not in ('skip', 'update'):
+            raise ValueError("on_conflict must be 'skip' or 'update'")
+        self.batch_size = batch_size or settings.STUDENT_IMPORT_BATCH_SIZE
+        self.on_conflict = on_conflict
+        self.single_transaction = single_transaction
+        self.progress = progress
+        self.departments = {}
+
+    def load_departments(self):
+        self.departments = {department.code: department for department in Department.objects.all()}
+
+    def import_csv(self, file, encoding='utf-8-sig'):
+        """Streams a CSV upload one batch at a time.
+
+        Each batch is validated and inserted before the next one is read, so
+        apart from the admission numbers seen so far memory use does not grow
+        with the size of the file.
+        """
+        self.load_departments()
+        text = TextIOWrapper(file, encoding=encoding, newline='')
+        try:
+            reader = csv.DictReader(text)
+            missing = [column for column in COLUMNS if column not in (reader.fieldnames or [])]
+            if missing:
+                raise ImportFormatError('Missing columns: {}'.format(', '.join(missing)))
+            return self.run(self.clean_row(row, reader.line_num) for row in reader)
+        finally:
+            # hand the upload back to the caller instead of closing it with the wrapper
+            text.detach()
+
+    def run(self, records):
+        started = time.perf_counter()
+        result = ImportResult()
+        records = iter(records)
+        # admission numbers of the rows accepted so far, so a repeat in a later batch is rejected too
+        seen = set()
+        with transaction.atomic() if self.single_transaction else nullcontext():
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    self.write_batch(batch, seen, result)
+                    # bulk_create sends no post_save, so the cached counts are cleared here
+                    transaction.on_commit(invalidate_dashboard_counts)
+                    transaction.on_commit(bump_list_generation)
+                result.elapsed = time.perf_counter() - started
+                if self.progress:
+                    self.progress(result)
+        result.elapsed = time.perf_counter() - started
+        for outcome, rows in (('created', result.created), ('updated', result.updated), ('skipped', result.skipped),
+                              ('rejected', len(result.rejected))):
+            if rows:
+                IMPORT_ROWS.inc(rows, result=outcome)
+        return result
+
+    def clean_row(self, row, line):
+        record = {}
+        for column, field in COLUMNS.items():
+            value = (row.get(column) or '').strip()
+            record[field] = value or None
+        record['row'] = line
+        record['date_of_birth'] = parse_date(record['date_of_birth'] or '')
+        record['date_of_join'] = parse_date(record['date_of_join'] or '')
+        record['department'] = self.departments.get(record['department'])
+        record['feeconcession'] = (record['feeconcession'] or '').lower() == 'yes'
+        return record
+
+    def validate(self, record, seen, result):
+        admission_number = record['admission_number']
+        if not admission_number:
+            result.reject(record['row'], admission_number, 'Admission number is missing')
+        elif admission_number in seen:
+            result.reject(record['row'], admission_number, 'Admission number repeated in file')
+        elif len(admission_number) > Student._meta.get_field('admission_number').max_length:
+            result.reject(record['row'], admission_number, 'Admission number is too long')
+        elif not record['name']:
+            result.reject(record['row'], admission_number, 'Name is missing')
+        elif record['date_of_join'] is None:
+            result.reject(record['row'], admission_number, 'Invalid date of join')
+        elif reason := self.check_fields(record):
+            result.reject(record['row'], admission_number, reason)
+        else:
+            seen.add(admission_number)
+            return True
+        return False
+
+    def check_fields(self, record):
+        # what keeps the record out of its columns, if anything; choices are replaced by their stored value
+        for field in CHECKED_FIELDS:
+            value = record[field]
+            if value is None:
+                continue
+            model_field = Student._meta.get_field(field)
+            if field in CHOICES:
+                if value.lower() not in CHOICES[field]:
+                    return '{} must be one of {}'.format(
+                        model_field.verbose_name.capitalize(), ', '.join(CHOICES[field].values()))
+                record[field] = CHOICES[field][value.lower()]
+            elif len(value) > model_field.max_length:
+                return '{} is longer than {} characters'.format(model_field.verbose_name.capitalize(), model_field.max_length)
+        return None
+
+    def write_batch(self, records, seen, result):
+        records = [record for record in records if self.validate(record, seen, result)]
+        numbers = [record['admission_number'] for record in records]
+        if self.on_conflict == 'update':
+            existing = set(Student.objects.filter(admission_number__in=numbers).values_list('admission_number', flat=True))
+            students = [self.make_student(record) for record in records]
+            Student.objects.bulk_create(
+                students, batch_size=self.batch_size, update_conflicts=True,
+                unique_fields=['admission_number'], update_fields=UPDATE_FIELDS)
+            updated = sum(1 for student in students if student.admission_number in existing)
+            result.updated += updated
+            result.created += len(students) - updated
+            return
+        for attempt in range(2):
+            existing = set(Student.objects.filter(admission_number__in=numbers).values_list('admission_number', flat=True))
+            students = [self.make_student(record) for record in records if record['admission_number'] not in existing]
+            try:
+                with transaction.atomic():
+                    Student.objects.bulk_create(students, batch_size=self.batch_size)
+                break
+            except IntegrityError:
+                # another import added some of these admission numbers after the lookup; look again once
+                if attempt:
+                    raise
+        result.skipped += len(records) - len(students)
+        result.created += len(students)
+
+    def make_student(self, record):
+        return Student(
+            name=record['name'],
+            date_of_birth=record['date_of_birth'],
+            admission_number=record['admission_number'],
+            gender=record['gender'] or 'Male',
+            mobile=record['mobile'],
+            guardian=record['guardian'] or '',
+            guardian_relation=record['guardian_relation'] or 'Father',
+            address=record['address'],
+            department=record['department'],
+            religion=record['religion'],
+            community=record['community'],
+            category=record['category'],
+            date_of_join=record['date_of_join'],
+            feeconcession=record['feeconcession'],
+            active=True,
+        )
+
+
+def fail_stale_jobs():
+    """Marks failed the running jobs that have not finished a batch in STUDENT_IMPORT_STALE_AFTER seconds.
+
+    Their worker was stopped mid-import; the batches it committed stay. They
+    are not run again, as a file that brought the worker down would do it again.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.STUDENT_IMPORT_STALE_AFTER)
+    # jobs started before heartbeats were recorded only have started_at
+    stale = Q(heartbeat_at__lt=stale_before) | Q(heartbeat_at__isnull=True, started_at__lt=stale_before)
+    return ImportJob.objects.filter(stale, status='running').update(
+        status='failed', error='The import stopped without finishing; upload the file again to import the rest.',
+        finished_at=now)
+
+
+def process_import_job(job):
+    """Runs a claimed ImportJob, committing each batch and recording progress on the job."""
+    progress_fields = ['rows_processed', 'created', 'updated', 'skipped', 'rejected_count', 'rows_per_second',
+                       'heartbeat_at']
+
+    def progress(result):
+        job.update_progress(result)
+        job.save(update_fields=progress_fields)
+
+    importer = StudentImporter(
+        on_conflict=settings.STUDENT_IMPORT_ON_CONFLICT, single_transaction=False, progress=progress)
+    try:
+        with FileSystemStorage().open(job.uploaded_file.file_path, 'rb') as file:
+            result = importer.import_csv(file)
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+    else:
+        job.update_progress(result)
+        job.rejected = result.rejected
+        job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save()
+    return job
@@ -0,0 +1,33 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+from common.generations import bump_generation, generation
+
+# bumped on every student write, which retires all cached list counts at once
+GENERATION_KEY = 'student-list-generation'
+COUNT_TIMEOUT = 60 * 60
+
+
+def list_generation():
+    return generation(GENERATION_KEY)
+
+
+def bump_list_generation():
+    bump_generation(GENERATION_KEY)
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that keeps the COUNT(*) of each distinct query in the cache until students change."""
+
+    @cached_property
+    def count(self):
+        sql = str(self.object_list.query).encode()
+        key = 'student-list-count:{}:{}'.format(list_generation(), hashlib.md5(sql).hexdigest())
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, COUNT_TIMEOUT)
+        return count
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from common.checks import PER_PROCESS_CACHES
+from students.importer import fail_stale_jobs, process_import_job
+from students.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = 'Runs queued student imports. Start one or more of these next to the web workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of waiting for new jobs.')
+
+    def handle(self, *args, **options):
+        if settings.CACHES['default']['BACKEND'] in PER_PROCESS_CACHES:
+            # each batch retires the cached dashboard and list counts through the cache
+            self.stderr.write('The default cache is not shared with the web workers: their student counts will '
+                              'lag behind imports until they time out. Point CACHE_URL at a shared cache.')
+        while True:
+            close_old_connections()
+            failed = fail_stale_jobs()
+            if failed:
+                self.stdout.write('Marked {} stopped import(s) failed'.format(failed))
+            job = self.claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            self.stdout.write('Importing {}'.format(job.uploaded_file.file_name))
+            process_import_job(job)
+            self.stdout.write('{}: {} rows, {} rejected, {:.0f} rows/s'.format(
+                job.status, job.rows_processed, job.rejected_count, job.rows_per_second))
+
+    def claim_next_job(self):
+        # the conditional update lets several workers share the queue without double-running a job
+        for job in ImportJob.objects.filter(status='queued').select_related('uploaded_file').order_by('id')[:10]:
+            started_at = timezone.now()
+            claimed = ImportJob.objects.filter(pk=job.pk, status='queued').update(
+                status='running', started_at=started_at, heartbeat_at=started_at)
+            if claimed:
+                job.status = 'running'
+                job.started_at = job.heartbeat_at = started_at
+                return job
+        return None
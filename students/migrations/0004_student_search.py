@@ -0,0 +1,85 @@
+import sqlite3
+
+from django.db import DatabaseError, migrations, transaction
+
+FTS_TABLE = 'students_student_fts'
+
+SQLITE_FORWARD = [
+    # external content table: the text stays in students_student, the FTS table only holds the index
+    """CREATE VIRTUAL TABLE {fts} USING fts5(
+        name, admission_number, content='students_student', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER {fts}_ai AFTER INSERT ON students_student BEGIN
+        INSERT INTO {fts}(rowid, name, admission_number) VALUES (new.id, new.name, new.admission_number);
+    END""",
+    """CREATE TRIGGER {fts}_ad AFTER DELETE ON students_student BEGIN
+        INSERT INTO {fts}({fts}, rowid, name, admission_number) VALUES ('delete', old.id, old.name, old.admission_number);
+    END""",
+    """CREATE TRIGGER {fts}_au AFTER UPDATE OF name, admission_number ON students_student BEGIN
+        INSERT INTO {fts}({fts}, rowid, name, admission_number) VALUES ('delete', old.id, old.name, old.admission_number);
+        INSERT INTO {fts}(rowid, name, admission_number) VALUES (new.id, new.name, new.admission_number);
+    END""",
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS {fts}_ai',
+    'DROP TRIGGER IF EXISTS {fts}_ad',
+    'DROP TRIGGER IF EXISTS {fts}_au',
+    'DROP TABLE IF EXISTS {fts}',
+]
+POSTGRESQL_FORWARD = [
+    'CREATE INDEX IF NOT EXISTS students_student_name_trgm ON students_student USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS students_student_admission_number_trgm ON students_student USING gin (admission_number gin_trgm_ops)',
+]
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS students_student_name_trgm',
+    'DROP INDEX IF EXISTS students_student_admission_number_trgm',
+]
+
+
+def trigram_extension(schema_editor):
+    """Whether pg_trgm is installed, installing it if the migrating role may.
+
+    CREATE EXTENSION pg_trgm needs a superuser before PostgreSQL 13 and the
+    CREATE privilege on the database from 13 on. Without it search still
+    works, by ILIKE over the whole table; to add the indexes later have a
+    superuser run CREATE EXTENSION pg_trgm, then migrate students back to
+    0003 and forward again.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone():
+            return True
+    try:
+        # a savepoint, as a failed statement would abort the rest of the migration
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION pg_trgm')
+    except DatabaseError:
+        return False
+    return True
+
+
+def run(statements, forward=False):
+    def operation(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor == 'sqlite' and sqlite3.sqlite_version_info < (3, 34, 0):
+            # no trigram tokenizer, search.search_students falls back to icontains
+            return
+        if connection.vendor == 'postgresql' and forward and not trigram_extension(schema_editor):
+            return
+        for statement in statements.get(connection.vendor, []):
+            schema_editor.execute(statement.format(fts=FTS_TABLE))
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0003_importjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}, forward=True),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
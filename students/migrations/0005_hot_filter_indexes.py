@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_tools', '0001_initial'),
+        ('students', '0004_student_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(('active', True)), fields=['data_verified', 'admission_number'], name='student_active_verified_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from admin_tools.models import Department, AcademicSession,Classroom
 # Create your models here.
@@ -13,6 +14,13 @@ gender_choice = (
     ('Female', 'Female')
 )
 
+import_status_choice = (
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
 
 class UploadedFile(models.Model):
     file_name = models.CharField(max_length=255)
@@ -20,6 +28,50 @@ class UploadedFile(models.Model):
     upload_date = models.DateTimeField(auto_now_add=True)
 
 
+class ImportJob(models.Model):
+    uploaded_file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=import_status_choice, default='queued')
+    rows_processed = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    rejected_count = models.IntegerField(default=0)
+    rejected = models.JSONField(default=list, blank=True)
+    rows_per_second = models.FloatField(default=0)
+    error = models.TextField(blank=True, default='')
+    queued_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # moved on after every batch, so a job whose worker died can be told apart from a slow one
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def update_progress(self, result):
+        self.rows_processed = result.rows
+        self.created = result.created
+        self.updated = result.updated
+        self.skipped = result.skipped
+        self.rejected_count = len(result.rejected)
+        self.rows_per_second = result.rows_per_second
+        self.heartbeat_at = timezone.now()
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'file_name': self.uploaded_file.file_name,
+            'status': self.status,
+            'rows_processed': self.rows_processed,
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'rejected_count': self.rejected_count,
+            'rows_per_second': round(self.rows_per_second, 1),
+            'error': self.error,
+        }
+
+    def __str__(self):
+        return '{} ({})'.format(self.uploaded_file.file_name, self.status)
+
+
 class Student(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True,blank=True)
     name = models.CharField(max_length=100)
@@ -49,4 +101,9 @@ class Student(models.Model):
         return '{} ({})-{}'.format(
             self.name, self.admission_number,self.department.name )
     class Meta:
-        ordering = ['admission_number','department']
\ No newline at end of file
+        ordering = ['admission_number','department']
+        indexes = [
+            # pending verification / verified lists, in admission number order
+            models.Index(fields=['data_verified', 'admission_number'], condition=models.Q(active=True),
+                         name='student_active_verified_idx'),
+        ]
\ No newline at end of file
@@ -0,0 +1,86 @@
+import sqlite3
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'students_student_fts'
+# FTS5 trigram tokenizer (SQLite 3.34+) matches any substring of three or more characters
+TRIGRAM_MIN_LENGTH = 3
+
+
+# databases the index was found in; it is only dropped by migrating students back before 0004
+_fts_databases = set()
+
+
+def fts_supported():
+    """Whether the search index can be used: SQLite 3.34+ and migration 0004 applied to this database."""
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts_databases:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            if cursor.fetchone() is None:
+                return False
+        _fts_databases.add(name)
+    return True
+
+
+def matching_ids(term, limit=None):
+    """Subquery of student ids matching term from the search index, or None where there is none."""
+    if len(term) < TRIGRAM_MIN_LENGTH:
+        return None
+    if connection.vendor == 'sqlite' and fts_supported():
+        # a quoted string is matched as one phrase, i.e. as a substring
+        sql = 'SELECT rowid FROM {0} WHERE {0} MATCH %s'.format(FTS_TABLE)
+        params = ['"{}"'.format(term.replace('"', '""'))]
+    elif connection.vendor == 'postgresql':
+        # plain ILIKE, as that is what the gin_trgm_ops indexes serve (icontains wraps the column in UPPER())
+        sql = 'SELECT id FROM students_student WHERE name ILIKE %s OR admission_number ILIKE %s'
+        pattern = '%{}%'.format(term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+        params = [pattern, pattern]
+    else:
+        return None
+    if limit:
+        sql += ' LIMIT %d' % limit
+    return RawSQL(sql, params)
+
+
+def search_students(queryset, term):
+    """Filters students whose name or admission number contains term, case-insensitively.
+
+    Same results as icontains on both fields, but answered from the FTS5
+    trigram index on SQLite or the pg_trgm GIN indexes on PostgreSQL instead
+    of scanning the table. Terms shorter than a trigram fall back to icontains.
+    """
+    term = term.strip()
+    if not term:
+        return queryset
+    ids = matching_ids(term)
+    if ids is None:
+        return queryset.filter(Q(name__icontains=term) | Q(admission_number__icontains=term))
+    return queryset.filter(id__in=ids)
+
+
+def autocomplete(queryset, term, limit=10):
+    """Top matches for the search box as dicts, admission numbers starting with term first.
+
+    Below TRIGRAM_MIN_LENGTH only admission number prefixes are looked up, as
+    a name substring that short cannot use the index.
+    """
+    term = term.strip()
+    if not term:
+        return []
+    fields = ('id', 'name', 'admission_number')
+    # a range on the unique index rather than startswith, which SQLite runs as a LIKE scan
+    students = list(queryset.filter(admission_number__gte=term, admission_number__lt=term + '\uffff')
+                    .order_by('admission_number').values(*fields)[:limit])
+    # the index stops after enough matches instead of finding every one and sorting them;
+    # twice the limit leaves room for the prefix matches excluded below
+    ids = matching_ids(term, limit * 2)
+    if len(students) < limit and ids is not None:
+        found = [student['id'] for student in students]
+        students += queryset.filter(id__in=ids).exclude(id__in=found).order_by('admission_number').values(
+            *fields)[:limit - len(students)]
+    return students
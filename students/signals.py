@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .listing import bump_list_generation
+from .models import Student
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_list_counts(sender, instance, **kwargs):
+    transaction.on_commit(bump_list_generation)
@@ -1,3 +1,341 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from admin_tools.models import Department
+from common.tests import read_xlsx
+from .importer import COLUMNS, StudentImporter
+from .listing import CachedCountPaginator
+from .search import autocomplete, search_students
+from .models import ImportJob, Student, UploadedFile
+
+
+def make_row(admission_number, **values):
+    row = {column: '' for column in COLUMNS}
+    row.update({
+        'Name': 'Student {}'.format(admission_number),
+        'Date  of Birth': '01-01-2004',
+        'Adm No.': admission_number,
+        'Gender': 'Male',
+        'Branch of Study': 'CT',
+        'Date ofJoin': '01-08-2021',
+        'Whether in receipt of fee concession': 'yes',
+    })
+    row.update(values)
+    return row
+
+
+def make_csv(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(COLUMNS))
+    writer.writeheader()
+    writer.writerows(rows)
+    return io.BytesIO(out.getvalue().encode())
+
+
+class StudentImporterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Computer Engineering', code='CT')
+
+    def import_rows(self, rows, **options):
+        return StudentImporter(**options).import_csv(make_csv(rows))
+
+    def test_creates_students(self):
+        result = self.import_rows([make_row('1001'), make_row('1002', Gender='female', Mobile='9876543210')])
+        self.assertEqual((result.created, result.updated, result.skipped, result.rejected), (2, 0, 0, []))
+        student = Student.objects.get(admission_number='1002')
+        self.assertEqual(student.department, self.department)
+        self.assertEqual(student.gender, 'Female')
+        self.assertEqual(student.mobile, '9876543210')
+        self.assertTrue(student.feeconcession)
+
+    def test_skip_leaves_existing_students_alone(self):
+        self.import_rows([make_row('1001')])
+        result = self.import_rows([make_row('1001', Name='Renamed'), make_row('1002')], on_conflict='skip')
+        self.assertEqual((result.created, result.updated, result.skipped), (1, 0, 1))
+        self.assertEqual(Student.objects.get(admission_number='1001').name, 'Student 1001')
+
+    def test_update_overwrites_existing_students(self):
+        self.import_rows([make_row('1001')])
+        result = self.import_rows([make_row('1001', Name='Renamed'), make_row('1002')], on_conflict='update')
+        self.assertEqual((result.created, result.updated, result.skipped), (1, 1, 0))
+        self.assertEqual(Student.objects.get(admission_number='1001').name, 'Renamed')
+
+    def test_rejected_rows_keep_their_line_numbers(self):
+        result = self.import_rows([
+            make_row('1001'),
+            make_row(''),
+            make_row('1001'),
+            make_row('12345678901'),
+            make_row('1004', **{'Date ofJoin': '2021-08-01'}),
+            make_row('1005', Mobile='9' * 14),
+            make_row('1006', Gender='Other'),
+            make_row('1007', **{'Relashionship with guardian': 'neighbour'}),
+            make_row('1008', Religion='x' * 21),
+            make_row('1009'),
+        ])
+        self.assertEqual(result.created, 2)
+        self.assertEqual([(rejected['row'], rejected['admission_number']) for rejected in result.rejected], [
+            (3, None), (4, '1001'), (5, '12345678901'), (6, '1004'), (7, '1005'), (8, '1006'), (9, '1007'), (10, '1008'),
+        ])
+        self.assertEqual(result.rejected[4]['reason'], 'Mobile is longer than 13 characters')
+        self.assertEqual(result.rejected[5]['reason'], 'Gender must be one of Male, Female')
+        self.assertFalse(Student.objects.exclude(admission_number__in=['1001', '1009']).exists())
+
+    def test_choices_are_matched_whatever_the_case(self):
+        self.import_rows([make_row('1001', Gender='FEMALE', **{'Relashionship with guardian': 'Mother'})])
+        student = Student.objects.get(admission_number='1001')
+        self.assertEqual((student.gender, student.guardian_relation), ('Female', 'mother'))
+
+    def test_repeat_in_a_later_batch_is_rejected(self):
+        for on_conflict in ('skip', 'update'):
+            Student.objects.all().delete()
+            result = self.import_rows([make_row('1001'), make_row('1002'), make_row('1001', Name='Repeat')],
+                                      batch_size=2, on_conflict=on_conflict)
+            self.assertEqual((result.created, result.updated, result.skipped), (2, 0, 0))
+            self.assertEqual([(rejected['row'], rejected['reason']) for rejected in result.rejected],
+                             [(4, 'Admission number repeated in file')])
+            self.assertEqual(Student.objects.get(admission_number='1001').name, 'Student 1001')
+
+    def test_student_added_meanwhile_is_skipped_not_created(self):
+        Student.objects.create(name='Elsewhere', admission_number='1001', department=self.department)
+        lookup = Student.objects.filter
+        calls = []
+
+        def stale_lookup(*args, **kwargs):
+            # another import adds 1001 between the first lookup and the insert
+            calls.append(1)
+            return Student.objects.none() if len(calls) == 1 else lookup(*args, **kwargs)
+
+        with mock.patch.object(Student.objects, 'filter', stale_lookup):
+            result = self.import_rows([make_row('1001'), make_row('1002')])
+        self.assertEqual((result.created, result.skipped), (1, 1))
+        self.assertEqual(Student.objects.get(admission_number='1001').name, 'Elsewhere')
+
+    def test_progress_is_reported_after_every_batch(self):
+        rows = []
+        self.import_rows([make_row(str(1000 + i)) for i in range(5)], batch_size=2,
+                         progress=lambda result: rows.append(result.rows))
+        self.assertEqual(rows, [2, 4, 5])
+        self.assertEqual(Student.objects.count(), 5)
+
+    def failing_import(self, **options):
+        bulk_create = Student.objects.bulk_create
+        calls = []
+
+        def fail_second_batch(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return bulk_create(*args, **kwargs)
+
+        rows = [make_row(str(1000 + i)) for i in range(4)]
+        with mock.patch.object(Student.objects, 'bulk_create', fail_second_batch), self.assertRaises(RuntimeError):
+            self.import_rows(rows, batch_size=2, **options)
+
+    def test_single_transaction_rolls_back_every_batch(self):
+        self.failing_import()
+        self.assertEqual(Student.objects.count(), 0)
+
+    def test_batches_commit_on_their_own(self):
+        self.failing_import(single_transaction=False)
+        self.assertEqual(sorted(Student.objects.values_list('admission_number', flat=True)), ['1000', '1001'])
+
+
+class ImportWorkerTest(TestCase):
+
+    def setUp(self):
+        Department.objects.create(name='Computer Engineering', code='CT')
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        with open(os.path.join(media.name, 'students.csv'), 'wb') as file:
+            file.write(make_csv([make_row('1001'), make_row('1002')]).getvalue())
+
+    def make_job(self, **fields):
+        uploaded_file = UploadedFile.objects.create(file_name='students.csv', file_path='students.csv')
+        return ImportJob.objects.create(uploaded_file=uploaded_file, **fields)
+
+    def run_worker(self):
+        # the worker's connection housekeeping would close the test's transaction
+        with mock.patch('students.management.commands.importworker.close_old_connections'):
+            call_command('importworker', '--once', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_runs_queued_job(self):
+        job = self.make_job()
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created), ('done', 2))
+        self.assertIsNotNone(job.heartbeat_at)
+        self.assertEqual(Student.objects.count(), 2)
+
+    def test_fails_jobs_whose_worker_stopped(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        stopped = self.make_job(status='running', started_at=long_ago, heartbeat_at=long_ago)
+        before_heartbeats = self.make_job(status='running', started_at=long_ago)
+        slow = self.make_job(status='running', started_at=long_ago, heartbeat_at=timezone.now())
+        self.run_worker()
+        for job in (stopped, before_heartbeats, slow):
+            job.refresh_from_db()
+        self.assertEqual((stopped.status, before_heartbeats.status, slow.status), ('failed', 'failed', 'running'))
+        self.assertTrue(stopped.error)
+        self.assertIsNotNone(stopped.finished_at)
+
+
+class CachedCountPaginatorTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='Computer Engineering', code='CT')
+
+    def count(self):
+        return CachedCountPaginator(Student.objects.order_by('admission_number'), 10).count
+
+    def add_student(self, number):
+        Student.objects.bulk_create([Student(name=number, admission_number=number, department=self.department)])
+
+    def test_count_is_cached_until_students_change(self):
+        self.add_student('1001')
+        self.assertEqual(self.count(), 1)
+        self.add_student('1002')
+        self.assertEqual(self.count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(name='1003', admission_number='1003', department=self.department)
+        self.assertEqual(self.count(), 3)
+
+    def test_cached_count_costs_no_queries(self):
+        self.add_student('1001')
+        self.count()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(), 1)
+
+    def test_import_batch_retires_cached_count(self):
+        self.add_student('1001')
+        self.assertEqual(self.count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentImporter().import_csv(make_csv([make_row('1002')]))
+        self.assertEqual(self.count(), 2)
+
+
+class StudentSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(name='Computer Engineering', code='CT')
+        for number, name in (('1001', 'Anjali Menon'), ('1002', 'Arjun Nair'), ('2200', 'Meera Das'),
+                             ('3001', 'Rahul 100% Raj')):
+            Student.objects.create(name=name, admission_number=number, department=department)
+
+    def search(self, term):
+        return sorted(search_students(Student.objects.all(), term).values_list('admission_number', flat=True))
+
+    def test_matches_name_and_admission_number_substrings(self):
+        self.assertEqual(self.search('MENON'), ['1001'])
+        self.assertEqual(self.search('nai'), ['1002'])
+        self.assertEqual(self.search('100'), ['1001', '1002', '3001'])
+        self.assertEqual(self.search('0% R'), ['3001'])
+        self.assertEqual(self.search('  '), ['1001', '1002', '2200', '3001'])
+
+    def test_short_terms_match_like_icontains(self):
+        self.assertEqual(self.search('ar'), ['1002'])
+        self.assertEqual(self.search('22'), ['2200'])
+
+    def test_index_follows_renames(self):
+        Student.objects.filter(admission_number='2200').update(name='Meera Krishnan')
+        self.assertEqual(self.search('krish'), ['2200'])
+        self.assertEqual(self.search('Das'), [])
+
+    def test_autocomplete_puts_admission_number_prefixes_first(self):
+        results = autocomplete(Student.objects.all(), '100')
+        self.assertEqual([student['admission_number'] for student in results], ['1001', '1002', '3001'])
+        self.assertEqual(set(results[0]), {'id', 'name', 'admission_number'})
+        self.assertEqual(len(autocomplete(Student.objects.all(), '100', limit=2)), 2)
+
+    def test_autocomplete_view_clamps_the_limit(self):
+        url = reverse('students:student_autocomplete')
+        for limit, expected in (('-5', 1), ('0', 1), ('abc', 3), ('2', 2), ('500', 3)):
+            response = self.client.get(url, {'q': '100', 'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), expected, limit)
+
+
+@override_settings(STUDENT_IMPORT_BACKGROUND=False)
+class UploadBusyTest(TestCase):
+
+    def test_upload_is_refused_while_imports_fill_the_queue(self):
+        Department.objects.create(name='Computer Engineering', code='CT')
+        upload = make_csv([make_row('1001')])
+        upload.name = 'students.csv'
+        with mock.patch('common.executors.get_executor', return_value=('thread', mock.Mock(), threading.Semaphore(0))):
+            response = self.client.post(reverse('students:import_students'), {'csv_file': upload})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Student.objects.exists())
+
+
+class StudentExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='x')
+        computer = Department.objects.create(name='Computer Engineering', code='CT')
+        mechanical = Department.objects.create(name='Mechanical Engineering', code='ME')
+        for number, department, active, verified in (('1002', computer, True, True), ('1001', computer, False, True),
+                                                     ('1003', mechanical, True, False)):
+            Student.objects.create(name='Student, "{}"'.format(number), admission_number=number, department=department,
+                                   active=active, data_verified=verified)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('students:export_students'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def exported_csv(self, **params):
+        return list(csv.reader(io.StringIO(self.export(**params).decode('utf-8-sig'))))
+
+    def test_csv_lists_students_in_admission_number_order(self):
+        rows = self.exported_csv()
+        self.assertEqual(rows[0][:3], ['Admission Number', 'Registration Number', 'Name'])
+        self.assertEqual([row[0] for row in rows[1:]], ['1001', '1002', '1003'])
+        self.assertEqual(rows[1][2], 'Student, "1001"')
+        self.assertEqual(rows[1][5], 'Computer Engineering')
+        self.assertEqual(rows[1][-2:], ['No', 'Yes'])
+
+    def test_filters(self):
+        for params, expected in (({'department': 'CT'}, ['1001', '1002']), ({'active': 'yes'}, ['1002', '1003']),
+                                 ({'verified': 'no'}, ['1003']), ({'department': 'ME', 'active': 'no'}, [])):
+            self.assertEqual([row[0] for row in self.exported_csv(**params)[1:]], expected, params)
+
+    def test_xlsx(self):
+        response = self.client.get(reverse('students:export_students'), {'format': 'xlsx', 'active': 'true'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="students.xlsx"')
+        rows = read_xlsx(b''.join(response.streaming_content))
+        self.assertEqual([row[0][2] for row in rows], ['Admission Number', '1002', '1003'])
+        self.assertEqual(rows[1][2][2], 'Student, "1002"')
+
+    def test_bad_parameters_are_refused(self):
+        for params in ({'format': 'pdf'}, {'active': 'maybe'}, {'verified': '2'}):
+            response = self.client.get(reverse('students:export_students'), params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_login_is_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('students:export_students'))
+        self.assertEqual(response.status_code, 302)
@@ -11,6 +11,9 @@ urlpatterns = [
     path('students/<int:pk>/edit/', views.StudentEditView.as_view(), name='edit_student'),
     path('students_page/', views.AllStudents.as_view(), name='students_page'),
     path('save_imported_students/', views.save_imported_students, name='save_imported_students'),
-    path('import_students/', views.ImportStudentsView.as_view(), name='import_students'),
+    path('import_students/', views.AsyncImportStudentsView.as_view(), name='import_students'),
     path('list_uploaded_files/', views.list_uploaded_files, name='list_uploaded_files'),
+    path('autocomplete/', views.student_autocomplete, name='student_autocomplete'),
+    path('export/', views.export_students, name='export_students'),
+    path('import_jobs/<int:pk>/status/', views.import_job_status, name='import_job_status'),
 ]
@@ -1,21 +1,22 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
-from .models import Student, UploadedFile
+from .models import Student, UploadedFile, ImportJob
 from django.core.paginator import Paginator
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
+from django.contrib.auth.decorators import login_required
 from django.urls import reverse
-from django.db.models import Q
+from django.db.models import Exists, OuterRef
 from .forms import StudentEditForm
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
 from tc.models import TcApplication
 from django.contrib import messages
-from io import TextIOWrapper
-import csv
-from datetime import datetime
-from .models import Student, UploadedFile
-import pandas as pd
-from .models import Department
+from .importer import StudentImporter, ImportFormatError
+from .search import search_students, autocomplete
+from .listing import CachedCountPaginator
+from asgiref.sync import sync_to_async
+from common.executors import ExecutorBusy, run_heavy
+from common.exports import CONTENT_TYPES, export_response, model_rows, parse_flag
 
 class ImportStudentsView(View):
     def get(self, request):
@@ -27,119 +28,163 @@ class ImportStudentsView(View):
         if not csv_file:
             messages.error(request, 'No file uploaded.')
             return render(request, 'students/upload.html')
-        self.handle_uploaded_file(request.FILES['csv_file'])
+        if settings.STUDENT_IMPORT_BACKGROUND:
+            job = self.queue_uploaded_file(csv_file)
+            messages.success(request, 'File successfully uploaded. The import will continue in the background.')
+            return render(request, 'students/upload.html', {'job': job})
+        try:
+            result = self.handle_uploaded_file(request.FILES['csv_file'])
+        except ImportFormatError as e:
+            messages.error(request, str(e))
+            return render(request, 'students/upload.html')
 
         # Provide a success message
-        messages.success(request, 'File successfully uploaded.')
-        return render(request, 'students/upload.html')
+        messages.success(request, 'File successfully uploaded. {}'.format(result))
+        return render(request, 'students/upload.html', {'result': result})
     def handle_uploaded_file(self,file):
-        def convert_date(date_str):
+        importer = StudentImporter(on_conflict=settings.STUDENT_IMPORT_ON_CONFLICT)
+        return importer.import_csv(file)
+    def queue_uploaded_file(self,file):
+        file_path = FileSystemStorage().save('imports/' + file.name, file)
+        uploaded_file = UploadedFile.objects.create(file_name=file.name, file_path=file_path)
+        return ImportJob.objects.create(uploaded_file=uploaded_file)
+
+class AsyncImportStudentsView(ImportStudentsView):
+    # parses and writes the csv in the 'import' executor, so a big upload does not hold up
+    # the thread synchronous views run in under ASGI
+    async def get(self, request):
+        return await sync_to_async(render)(request, 'students/upload.html')
+
+    async def post(self, request):
+        csv_file = request.FILES.get('csv_file')
+        if not csv_file:
+            messages.error(request, 'No file uploaded.')
+            return await sync_to_async(render)(request, 'students/upload.html')
+        if settings.STUDENT_IMPORT_BACKGROUND:
+            job = await sync_to_async(self.queue_uploaded_file)(csv_file)
+            messages.success(request, 'File successfully uploaded. The import will continue in the background.')
+            return await sync_to_async(render)(request, 'students/upload.html', {'job': job})
+        try:
+            result = await run_heavy('import', self.handle_uploaded_file, csv_file)
+        except ImportFormatError as e:
+            messages.error(request, str(e))
+            return await sync_to_async(render)(request, 'students/upload.html')
+        except ExecutorBusy:
+            messages.error(request, 'Other imports are still running, try again shortly.')
+            return await sync_to_async(render)(request, 'students/upload.html', status=503)
+
+        messages.success(request, 'File successfully uploaded. {}'.format(result))
+        return await sync_to_async(render)(request, 'students/upload.html', {'result': result})
+
+
+def list_uploaded_files(request):
+    jobs = ImportJob.objects.select_related('uploaded_file').order_by('-id')
+    paginator = Paginator(jobs, 10)
+    jobs = paginator.get_page(request.GET.get('page'))
+    return render(request, 'students/list_uploaded_files.html', {'jobs': jobs})
+
+def import_job_status(request, pk):
+    job = get_object_or_404(ImportJob.objects.select_related('uploaded_file'), pk=pk)
+    return JsonResponse(job.as_dict())
+
+
+# header and Student field of each column of the students export
+STUDENT_EXPORT_COLUMNS = [
+    ('Admission Number', 'admission_number'),
+    ('Registration Number', 'registration_number'),
+    ('Name', 'name'),
+    ('Gender', 'gender'),
+    ('Date of Birth', 'date_of_birth'),
+    ('Department', 'department__name'),
+    ('Guardian', 'guardian'),
+    ('Relationship with Guardian', 'guardian_relation'),
+    ('Mobile', 'mobile'),
+    ('Guardian Mobile', 'guardian_mobile'),
+    ('Email', 'email'),
+    ('Address', 'address'),
+    ('Date of Join', 'date_of_join'),
+    ('Religion', 'religion'),
+    ('Community', 'community'),
+    ('Category', 'category'),
+    ('Fee Concession', 'feeconcession'),
+    ('Active', 'active'),
+    ('Data Verified', 'data_verified'),
+]
+
+@login_required
+def export_students(request):
+    # ?format=csv (default) or xlsx, ?department=<code>, ?active= and ?verified= yes or no
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in CONTENT_TYPES:
+        return HttpResponseBadRequest('format must be csv or xlsx')
+    filters = {}
+    department = request.GET.get('department', '').strip()
+    if department:
+        filters['department__code'] = department
+    for parameter, field in (('active', 'active'), ('verified', 'data_verified')):
+        if request.GET.get(parameter):
             try:
-                return datetime.strptime(date_str, "%d-%m-%Y").strftime("%Y-%m-%d")
+                filters[field] = parse_flag(request.GET[parameter])
             except ValueError:
-                return None  # Handle invalid date format
-        df = pd.read_csv(file)
-        for index, row in df.iterrows():
-            try:
-                department = Department.objects.get(code=row['Branch of Study'])
-            except Department.DoesNotExist:
-                print(row['Branch of Study'])
-                department = None  # Handle missing department case
-            Student.objects.create(
-                name=row['Name'],
-                date_of_birth=convert_date(row['Date  of Birth']),
-                admission_number=row['Adm No.'],
-                gender=row['Gender'],
-                mobile=row['Mobile'],
-                guardian=row['guardian'],
-                guardian_relation=row['Relashionship with guardian'],
-                address=row['address'],
-                department=department,
-                religion=row['Religion'],
-                community=row['Caste'],
-                category=row['Category'],
-                date_of_join=convert_date(row['Date ofJoin'])   ,
-                feeconcession=row['Whether in receipt of fee concession'].strip().lower() == 'yes',
-                active=True
-            
-            )
+                return HttpResponseBadRequest('{} must be yes or no'.format(parameter))
+    students = Student.objects.filter(**filters).select_related('department').order_by('admission_number')
+    fields = [field for header, field in STUDENT_EXPORT_COLUMNS]
+    return export_response(request, export_format, 'students', [header for header, field in STUDENT_EXPORT_COLUMNS],
+                           model_rows(students, fields), sheet_name='Students')
 
-def list_uploaded_files(request):
-    files = UploadedFile.objects.all()
-    return render(request, 'students/list_uploaded_files.html', {'files': files})
 
+def student_autocomplete(request):
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    return JsonResponse({'results': autocomplete(Student.objects.all(), request.GET.get('q', ''), limit)})
 
-class AllStudents(View):
+
+class StudentListView(View):
     template_name = 'students/students.html'
+    label = 'Students'
+    headers = {
+        'name': "Name",
+        'admission_number': "Admission Number",
+        'registration_number': "Registration Number",
+        'department': "Department",
+        'action': "Actions",
+    }
+    filter_criteria = {}
+    # only the columns students.html shows, with the department in the same query
+    list_fields = ['name', 'admission_number', 'registration_number', 'department__code']
+    paginate_by = 10
+
+    def search(self, students_objs, searchkey):
+        return students_objs.filter(admission_number=searchkey)
+
+    def get_queryset(self):
+        students_objs = Student.objects.filter(**self.filter_criteria)
+        searchkey = self.request.GET.get('a_number')
+        if searchkey:
+            students_objs = self.search(students_objs, searchkey)
+        return students_objs.select_related('department').only(*self.list_fields).order_by('admission_number')
+
     def get(self, request, *args, **kwargs):
-        context = {'label': 'Students'}
-        headers = {
-            'name': "Name",
-            'admission_number': "Admission Number",
-            'registration_number': "Registration Number",
-            'department': "Department",
-            'action': "Actions",
-        }
-        if 'a_number' in request.GET and request.GET['a_number']:
-            searchkey = request.GET['a_number']
-            students_objs = Student.objects.filter(Q(name__icontains=searchkey) | Q(admission_number__icontains=searchkey)).order_by('admission_number')
-        else:
-            students_objs = Student.objects.all().order_by('admission_number')
-        
-        paginator = Paginator(students_objs, 10)
+        paginator = CachedCountPaginator(self.get_queryset(), self.paginate_by)
         page = request.GET.get('page')
         students = paginator.get_page(page)
-        context['headers'] = headers
-        context['students'] = students
+        context = {'label': self.label, 'headers': self.headers, 'students': students}
         return render(request, self.template_name, context)
 
 
-class StudentsPendingVerification(View):
-    template_name = 'students/students.html'
-    def get(self, request, *args, **kwargs):
-        context = {'label': 'Students'}
-        headers = {
-            'name': "Name",
-            'admission_number': "Admission Number",
-            'registration_number': "Registration Number",
-            'department': "Department",
-            'action': "Actions",
-        }
-        filter_criteria = {'active': True, 'data_verified': False}
-        if 'a_number' in request.GET and request.GET['a_number']:
-            filter_criteria['admission_number'] = request.GET['a_number']
-        
-        students_objs = Student.objects.filter(**filter_criteria).order_by('admission_number')
-        paginator = Paginator(students_objs, 10)
-        page = request.GET.get('page')
-        students = paginator.get_page(page)
-        context['headers'] = headers
-        context['students'] = students
-        return render(request, self.template_name, context)
+class AllStudents(StudentListView):
+    def search(self, students_objs, searchkey):
+        return search_students(students_objs, searchkey)
 
 
-class VerifiedStudentView(View):
-    template_name = 'students/students.html'
-    def get(self, request, *args, **kwargs):
-        context = {'label': 'Students'}
-        headers = {
-            'name': "Name",
-            'admission_number': "Admission Number",
-            'registration_number': "Registration Number",
-            'department': "Department",
-            'action': "Actions",
-        }
-        filter_criteria = {'active': True, 'data_verified': True}
-        if 'a_number' in request.GET and request.GET['a_number']:
-            filter_criteria['admission_number'] = request.GET['a_number']
-        
-        students_objs = Student.objects.filter(**filter_criteria).order_by('admission_number')
-        paginator = Paginator(students_objs, 10)
-        page = request.GET.get('page')
-        students = paginator.get_page(page)
-        context['headers'] = headers
-        context['students'] = students
-        return render(request, self.template_name, context)
+class StudentsPendingVerification(StudentListView):
+    filter_criteria = {'active': True, 'data_verified': False}
+
+
+class VerifiedStudentView(StudentListView):
+    filter_criteria = {'active': True, 'data_verified': True}
 
 
 class StudentDetailView(View):
@@ -158,30 +203,36 @@ class StudentDetailView(View):
             return render(request, self.template_name, context)
         except Exception as e:
             print(e)
-            return HttpResponseRedirect(reverse('students:students'))
+            return HttpResponseRedirect(reverse('students:allstudents'))
 
 
 class StudentEditView(View):
     template_name = 'students/edit_students.html'
+
+    def get_student(self, student_id):
+        # whether to offer "Save and apply TC" comes back with the student
+        return get_object_or_404(Student.objects.annotate(
+            tc_exists=Exists(TcApplication.objects.filter(student_id=OuterRef('pk')))), pk=student_id)
+
     def get(self, request, *args, **kwargs):
         context = {}
         student_id = kwargs.pop('pk')
-        student = Student.objects.filter(pk=student_id).first()
-        form = StudentEditForm(instance=student)
+        student = self.get_student(student_id)
+        form = StudentEditForm(instance=student, tc_exists=student.tc_exists)
         context['form'] = form
         context['label'] = "Edit Student"
         return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         student_id = kwargs.get('pk')
-        student = Student.objects.filter(pk=student_id).first()
-        form = StudentEditForm(request.POST, instance=student)
+        student = self.get_student(student_id)
+        form = StudentEditForm(request.POST, instance=student, tc_exists=student.tc_exists)
         if request.POST.get('data_verified') == 'on' and form.is_valid():
             form.save()
             if request.POST.get('applytc') == 'Save and apply TC':
                 return HttpResponseRedirect(reverse('tc:apply_tc', args=(student_id,)))
             else:
-                return HttpResponseRedirect(reverse('students:students'))
+                return HttpResponseRedirect(reverse('students:allstudents'))
         else:
             context = {'form': form, 'label': "Edit Student"}
             return render(request, self.template_name, context)
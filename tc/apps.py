@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TcConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tc'
+
+    def ready(self):
+        from . import signals
@@ -1,15 +1,8 @@
+from datetime import datetime
 from .models import TcApplication,TcIssue
 from django.forms import ModelForm
-from crispy_forms.helper import FormHelper
-from crispy_forms.bootstrap import Tab, TabHolder
-from crispy_forms.layout import (Layout, Fieldset, Field,
-                                 ButtonHolder, Submit, Div)
 from django import forms
-from crispy_forms.helper import FormHelper
-from crispy_forms.layout import Layout, Submit, Row, Column,Button
-from django.urls import reverse
-from datetime import datetime
-from django.db.models import Max
+from common.layouts import form_helper
 
 class TcApplicationForm(ModelForm):
     class Meta:
@@ -41,38 +34,7 @@ class TcApplicationForm(ModelForm):
             self.fields['promotionDate'].initial = '2019-11-27'
             self.fields['reasonforLeaving'].initial ='Course Completed'
 
-        self.helper = FormHelper()
-        self.helper.layout = Layout()
-        done = False
-        index= 0
-        while index < len(fields):
-            row = Row()
-            row.append( Column(fields[index],css_class='form-group col-md-4 mb-0'))
-            index += 1
-            if index < len(fields):
-                row.append( Column(fields[index],css_class='form-group col-md-4 mb-0'))
-                index += 1
-            if index < len(fields):
-                row.append( Column(fields[index],css_class='form-group col-md-4 mb-0'))
-                index += 1
-            row.css_class='form-row'
-            self.helper.layout.append(row)
-        
-        for key,value in buttons.items():
-            self.helper.layout.append(Submit(key,value))
-        self.helper.layout.append(Button('cancel', 'Cancel', css_class='btn-primary',
-                             onclick="window.location.href = '{}';".format(reverse('students:students'))))
-
-    def clean(self,*args,**kwargs):
-        tcApplicationNumber = TcApplication.objects.all().aggregate(Max ('tc_application_Number')) ['tc_application_Number__max']
-        if tcApplicationNumber == None:
-            tcApplicationNumber = 1
-        else:
-            tcApplicationNumber +=1          
-        self.instance.tc_application_Number = tcApplicationNumber
-        self.instance.tc_application_Year = datetime.now().year
-        print("application number",self.instance.tc_application_Number)
-        return super().clean(*args,**kwargs)
+        self.helper = form_helper(fields, buttons, 'students:allstudents')
 
 class TCIssueForm(ModelForm):
     class Meta:
@@ -84,36 +46,16 @@ class TCIssueForm(ModelForm):
         fields = ['tcNumber','tcYear','conduct']
         buttons = {'issuetc':'Issue TC'}
         #self.fields['tcNumber'] = forms.CharField(disabled=True,initial=self.instance.tcNumber,label="TC Number")
-        self.helper = FormHelper()
-        self.helper.layout = Layout()
-        done = False
-        index= 0
-        while index < len(fields):
-            row = Row()
-            row.append( Column(fields[index],css_class='form-group col-md-4 mb-0'))
-            index += 1
-            if index < len(fields):
-                row.append( Column(fields[index],css_class='form-group col-md-4 mb-0'))
-                index += 1
-            if index < len(fields):
-                row.append( Column(fields[index],css_class='form-group col-md-4 mb-0'))
-                index += 1
-            row.css_class='form-row'
-            self.helper.layout.append(row)
-        
-        for key,value in buttons.items():
-            self.helper.layout.append(Submit(key,value))
-        self.helper.layout.append(Button('cancel', 'Cancel', css_class='btn-primary',
-                             onclick="window.location.href = '{}';".format(reverse('tc:all_tc'))))
+        self.helper = form_helper(fields, buttons, 'tc:all_tc')
 
-    def clean(self,*args,**kwargs):
-        print ("Clean function called")
-        tcApplicationNumber = TcApplication.objects.all().aggregate(Max ('tc_application_Number')) ['tc_application_Number__max']
-        if tcApplicationNumber == None:
-            tcApplicationNumber = 1
-        else:
-            tcApplicationNumber +=1          
-        self.instance.tc_application_Number = tcApplicationNumber
-        self.instance.tc_application_Year = datetime.now().year
-        print("application number",self.instance.tc_application_Number)
-        return super().clean(*args,**kwargs)     
\ No newline at end of file
+    def clean(self):
+        cleaned_data = super().clean()
+        tcNumber = cleaned_data.get('tcNumber')
+        tcYear = cleaned_data.get('tcYear') or datetime.now().year
+        #a number typed in by hand must not be one already on another TC of that year
+        if tcNumber is not None:
+            if tcNumber < 1:
+                self.add_error('tcNumber', 'TC number must be a positive number.')
+            elif TcApplication.objects.filter(tcYear=tcYear, tcNumber=tcNumber).exclude(pk=self.instance.pk).exists():
+                self.add_error('tcNumber', 'TC number {} is already issued for {}.'.format(tcNumber, tcYear))
+        return cleaned_data
@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+from django.db import transaction
+
+from account.counters import invalidate_dashboard_counts
+from . import numbering
+from .models import TcApplication
+
+ISSUE_FIELDS = ['tcNumber', 'tcYear', 'tc_issued', 'dateofIssue', 'dateofremovedfromrolls']
+
+
+def issue_all(tcapplications, year=None):
+    """Issues a TC to every application in the queryset and returns them in admission number order.
+
+    The numbers are one contiguous block, reserved in a single allocation and
+    saved with one bulk_update, so the cost does not grow with the number of
+    applications. The issue is committed straight away, so the row locks and
+    the lock on the number sequence are held for these few queries only;
+    if the certificates cannot be printed afterwards, pass the result to
+    revoke_issue().
+    """
+    year = year or datetime.now().year
+    today = date.today()
+    with transaction.atomic():
+        # locked so two clerks issuing at once cannot number the same applications twice
+        tcapplications = list(tcapplications.select_for_update(of=('self',)).order_by('student__admission_number'))
+        if not tcapplications:
+            return tcapplications
+        first = numbering.allocate('tc', year, count=len(tcapplications))
+        for tcNumber, tcapplication in enumerate(tcapplications, first):
+            tcapplication.tcNumber = tcNumber
+            tcapplication.tcYear = year
+            tcapplication.tc_issued = True
+            # auto_now is not applied by bulk_update
+            tcapplication.dateofIssue = today
+            tcapplication.dateofremovedfromrolls = today
+        TcApplication.objects.bulk_update(tcapplications, ISSUE_FIELDS)
+        # bulk_update sends no post_save; cached PDFs are keyed on the TC number, so only the counts go stale
+        transaction.on_commit(invalidate_dashboard_counts)
+    return tcapplications
+
+
+def revoke_issue(tcapplications):
+    """Undoes issue_all() for applications whose certificates could not be printed.
+
+    The applications go back to pending, and the block of numbers goes back
+    to the sequence unless more numbers have been allocated after it since.
+    """
+    if not tcapplications:
+        return
+    year = tcapplications[0].tcYear
+    first = tcapplications[0].tcNumber
+    count = len(tcapplications)
+    with transaction.atomic():
+        TcApplication.objects.filter(
+            pk__in=[tcapplication.pk for tcapplication in tcapplications],
+            tcYear=year, tcNumber__gte=first, tcNumber__lt=first + count,
+        ).update(tc_issued=False, tcNumber=None, tcYear=None)
+        numbering.release('tc', year, first, count)
+        transaction.on_commit(invalidate_dashboard_counts)
+    for tcapplication in tcapplications:
+        tcapplication.tc_issued = False
+        tcapplication.tcNumber = None
+        tcapplication.tcYear = None
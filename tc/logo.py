@@ -0,0 +1,51 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+
+# the watermark is printed half a page wide; the source image has far more pixels than that needs
+LOGO_DPI = 200
+
+
+def logo_version():
+    """Changes whenever TC_LOGO_PATH is replaced or LOGO_DPI changes; looked up afresh on every call."""
+    path = settings.TC_LOGO_PATH
+    stat = os.stat(path)
+    key = '\x1f'.join([path, str(stat.st_mtime_ns), str(stat.st_size), str(LOGO_DPI)])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def prepare_logo():
+    """The logo scaled to print size, flattened onto the white page and encoded as JPEG."""
+    with Image.open(settings.TC_LOGO_PATH) as image:
+        image = image.convert('RGBA')
+        side = round(A4[0] / 2 / inch * LOGO_DPI)
+        image.thumbnail((side, side))
+        flat = Image.new('RGB', image.size, 'white')
+        flat.paste(image, mask=image.getchannel('A'))
+    out = io.BytesIO()
+    flat.save(out, 'JPEG', quality=90)
+    return out.getvalue()
+
+
+def page_logo():
+    """Path of the prepared logo in TC_PDF_CACHE_DIR, written there on first use.
+
+    Given the path of a JPEG, drawImage copies the file into the document as
+    it is. Given the full size transparent PNG (or an ImageReader) it decodes,
+    hashes and recompresses the pixels in every document, which took most of
+    the time of a single certificate.
+    """
+    path = os.path.join(settings.TC_PDF_CACHE_DIR, 'logo-{}.jpg'.format(logo_version()))
+    if not os.path.exists(path):
+        os.makedirs(settings.TC_PDF_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=settings.TC_PDF_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(prepare_logo())
+        os.replace(tmp_path, path)
+    return path
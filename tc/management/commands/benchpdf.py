@@ -0,0 +1,121 @@
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from admin_tools.models import Department
+from students.models import Student
+from tc.models import TcApplication
+from tc.rendering import draw_pdf, render_pdf, stream_batch
+from tc.views import (APPLICATION_DOC_OPTIONS, TC_DOC_OPTIONS, AllPageSetup,
+                      prepareTC, prepareTCApplication)
+
+
+def synthetic_applications(count):
+    """Unsaved, fully populated applications, so rendering can be timed without a database."""
+    departments = [
+        Department(id=1, name='Computer Engineering', code='CT'),
+        Department(id=2, name='Electrical and Electronics Engineering', code='EE'),
+        Department(id=3, name='Mechanical Engineering', code='ME'),
+        Department(id=4, name='Civil Engineering', code='CE'),
+    ]
+    applications = []
+    for i in range(count):
+        student = Student(
+            id=i + 1,
+            name='Student Name {}'.format(i),
+            admission_number=str(20000 + i),
+            date_of_birth=date(2003, 1, 1) + timedelta(days=i % 1000),
+            date_of_join=date(2021, 8, 1),
+            department=departments[i % len(departments)],
+            guardian='Guardian {}'.format(i),
+            guardian_relation='father',
+            religion='Hindu',
+            community='Ezhava',
+            category='OBC',
+            feeconcession=i % 2 == 0,
+        )
+        applications.append(TcApplication(
+            id=i + 1,
+            student=student,
+            tc_application_Number=i + 1,
+            tc_application_Year=2024,
+            tcNumber=i + 1,
+            tcYear=2024,
+            dateofIssue=date(2024, 6, 1),
+            reasonforLeaving='Course Completed' if i % 3 else 'Course discontinued',
+            dateofApplication=date(2024, 5, 20),
+            promotionDate=date(2023, 11, 27),
+            lastAttendedDate=date(2024, 4, 30),
+            totalWorkingDay=78,
+            attendance=70,
+        ))
+    return applications
+
+
+class Command(BaseCommand):
+    help = 'Times bulk TC/application PDF rendering on synthetic data for different worker counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--applications', type=int, default=2000)
+        parser.add_argument('--workers', default='1,2,4',
+                            help="Comma separated TC_RENDER_WORKERS values to compare, up to the 'pdf' executor's own worker count.")
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--kind', choices=['tc', 'application'], default='tc')
+        parser.add_argument('--memory', action='store_true',
+                            help='Also report peak Python memory (tracemalloc slows rendering down).')
+        parser.add_argument('--prepare-only', action='store_true',
+                            help='Only time building the story of each certificate (styles, tables, dates in words).')
+        parser.add_argument('--single', action='store_true',
+                            help='Time rendering each certificate as its own PDF, with Platypus and with the cached layout.')
+
+    def handle(self, *args, **options):
+        applications = synthetic_applications(options['applications'])
+        if options['kind'] == 'tc':
+            prepare, doc_options = prepareTC, TC_DOC_OPTIONS
+        else:
+            prepare, doc_options = prepareTCApplication, APPLICATION_DOC_OPTIONS
+
+        if options['prepare_only']:
+            started = time.perf_counter()
+            for application in applications:
+                prepare(application)
+            elapsed = time.perf_counter() - started
+            self.stdout.write('{} {} stories: {:.2f}s, {:.0f} us per certificate'.format(
+                len(applications), options['kind'], elapsed, elapsed / len(applications) * 1e6))
+            return
+
+        if options['single']:
+            for renderer in (render_pdf, draw_pdf):
+                stories = [prepare(application) for application in applications]
+                started = time.perf_counter()
+                for story in stories:
+                    renderer(story, AllPageSetup, doc_options)
+                elapsed = time.perf_counter() - started
+                self.stdout.write('{} {} PDFs with {}: {:.2f}s, {:.2f} ms per certificate'.format(
+                    len(applications), options['kind'], renderer.__name__, elapsed, elapsed / len(applications) * 1e3))
+            return
+
+        baseline = None
+        for workers in [int(n) for n in options['workers'].split(',')]:
+            if options['memory']:
+                tracemalloc.start()
+            started = time.perf_counter()
+            first_part = None
+            size = 0
+            # consume the stream the way a response would, without keeping the document
+            for piece in stream_batch(applications, prepare, AllPageSetup, doc_options,
+                                      workers=workers, chunk_size=options['chunk_size']):
+                size += len(piece)
+                if first_part is None and size > 1024:
+                    first_part = time.perf_counter() - started
+            elapsed = time.perf_counter() - started
+            peak = ''
+            if options['memory']:
+                peak = ', peak {:.0f} KiB'.format(tracemalloc.get_traced_memory()[1] / 1024)
+                tracemalloc.stop()
+            baseline = baseline or elapsed
+            self.stdout.write('{} {} PDFs, {} workers: {:.2f}s (first chunk {:.2f}s), {:.0f} KiB{}, speedup {:.2f}x'.format(
+                len(applications), options['kind'], workers, elapsed, first_part or elapsed, size / 1024, peak,
+                baseline / elapsed))
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tc', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('tc', 'TC Number'), ('application', 'TC Application Number')], max_length=20)),
+                ('year', models.IntegerField()),
+                ('last_value', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('kind', 'year')},
+            },
+        ),
+    ]
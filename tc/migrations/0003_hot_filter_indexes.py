@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0005_hot_filter_indexes'),
+        ('tc', '0002_numbersequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tcapplication',
+            index=models.Index(condition=models.Q(('tc_issued', False)), fields=['id'], name='tc_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tcapplication',
+            index=models.Index(fields=['tcYear', 'tcNumber', 'id'], name='tc_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tcapplication',
+            index=models.Index(fields=['tc_application_Year', 'tc_application_Number'], name='tc_application_number_idx'),
+        ),
+    ]
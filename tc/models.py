@@ -41,6 +41,17 @@ class TcApplication(models.Model):
     tc_issued = models.BooleanField(default=False)
     def getTcNumber():
         pass
+
+    class Meta:
+        indexes = [
+            # pending list, newest first
+            models.Index(fields=['id'], condition=models.Q(tc_issued=False), name='tc_pending_idx'),
+            # issued list order and the highest TC number of a year
+            models.Index(fields=['tcYear', 'tcNumber', 'id'], name='tc_number_idx'),
+            # highest application number of a year
+            models.Index(fields=['tc_application_Year', 'tc_application_Number'], name='tc_application_number_idx'),
+        ]
+
     def __str__(self):
         return '{} ({})-{}'.format(
             self.student.name, self.tcNumber,self.student.department.name )
@@ -49,3 +60,22 @@ class TcIssue(models.Model):
     tcNumber=models.IntegerField()
     tcYear=models.IntegerField()
     tcApplication=models.ForeignKey(TcApplication ,on_delete=models.PROTECT)
+
+
+sequence_kind_choice = (
+    ('tc', 'TC Number'),
+    ('application', 'TC Application Number'),
+)
+
+
+class NumberSequence(models.Model):
+    """Last TC or application number handed out in a year, see tc.numbering."""
+    kind = models.CharField(max_length=20, choices=sequence_kind_choice)
+    year = models.IntegerField()
+    last_value = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('kind', 'year')
+
+    def __str__(self):
+        return '{} {}: {}'.format(self.kind, self.year, self.last_value)
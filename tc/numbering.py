@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import F, Max
+
+from common.metrics import Counter
+
+from .models import NumberSequence, TcApplication
+
+# sequence kind -> (number field, year field) on TcApplication
+FIELDS = {
+    'tc': ('tcNumber', 'tcYear'),
+    'application': ('tc_application_Number', 'tc_application_Year'),
+}
+NUMBERS_ALLOCATED = Counter('services_numbers_allocated_total', 'TC and application numbers handed out by allocate().',
+                            ['kind'])
+
+
+def highest_used(kind, year):
+    number_field, year_field = FIELDS[kind]
+    return TcApplication.objects.filter(**{year_field: year}).aggregate(Max(number_field))[number_field + '__max'] or 0
+
+
+def allocate(kind, year=None, count=1):
+    """Reserves count consecutive numbers for the year and returns the first one.
+
+    The UPDATE comes first, so the sequence row is locked before it is read
+    and two clerks can never be handed the same number. The first allocation
+    of a year seeds the row from the numbers already on TcApplication.
+    """
+    year = year or datetime.now().year
+    sequences = NumberSequence.objects.filter(kind=kind, year=year)
+    with transaction.atomic():
+        if not sequences.update(last_value=F('last_value') + count):
+            NumberSequence.objects.bulk_create(
+                [NumberSequence(kind=kind, year=year, last_value=highest_used(kind, year))], ignore_conflicts=True)
+            sequences.update(last_value=F('last_value') + count)
+        last_value = sequences.values_list('last_value', flat=True).get()
+        # numbers of a rolled back transaction go back to the sequence, so they are not counted
+        transaction.on_commit(lambda: NUMBERS_ALLOCATED.inc(count, kind=kind))
+    return last_value - count + 1
+
+
+def release(kind, year, first, count=1):
+    """Hands back the numbers allocate(kind, year, count) returned first for.
+
+    Only possible while they are still the last ones allocated; otherwise
+    they stay a gap in the sequence.
+    """
+    NumberSequence.objects.filter(kind=kind, year=year, last_value=first + count - 1).update(last_value=first - 1)
+
+
+def peek(kind, year=None):
+    """The number allocate() would hand out next, without reserving it."""
+    year = year or datetime.now().year
+    last_value = NumberSequence.objects.filter(kind=kind, year=year).values_list('last_value', flat=True).first()
+    return (highest_used(kind, year) if last_value is None else last_value) + 1
+
+
+def bump(kind, year, value):
+    """Records a number typed in by hand so allocate() continues after it."""
+    sequences = NumberSequence.objects.filter(kind=kind, year=year)
+    with transaction.atomic():
+        if not sequences.filter(last_value__lt=value).update(last_value=value) and not sequences.exists():
+            NumberSequence.objects.bulk_create(
+                [NumberSequence(kind=kind, year=year, last_value=max(value, highest_used(kind, year)))],
+                ignore_conflicts=True)
+            sequences.filter(last_value__lt=value).update(last_value=value)
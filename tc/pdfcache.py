@@ -0,0 +1,111 @@
+import glob
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from reportlab import Version as REPORTLAB_VERSION
+
+from .logo import logo_version
+
+# bump when the certificate layout changes so older renders are not served
+LAYOUT_VERSION = '3'
+# evict() lists the whole directory, so put() runs it at most once a minute,
+# or sooner once a tenth of TC_PDF_CACHE_MAX_BYTES has been written since the last run
+EVICT_INTERVAL = 60
+EVICT_AFTER_SHARE = 0.1
+_last_evict = 0.0
+_written_since_evict = 0
+
+APPLICATION_FIELDS = [
+    'tc_application_Number', 'tc_application_Year', 'tcNumber', 'tcYear', 'dateofIssue', 'conduct',
+    'reasonforLeaving', 'dateofApplication', 'promotionDate', 'lastclass', 'promotedtoHigherClass',
+    'proceedingInstitution', 'lastAttendedDate', 'totalWorkingDay', 'attendance',
+]
+STUDENT_FIELDS = [
+    'name', 'admission_number', 'date_of_birth', 'date_of_join', 'guardian', 'guardian_relation',
+    'religion', 'community', 'category', 'feeconcession',
+]
+
+
+def cache_key(kind, tcapplication, renderer=''):
+    """Hash of everything that ends up on the printed document, and of what drew it."""
+    student = tcapplication.student
+    values = [kind, LAYOUT_VERSION, renderer, REPORTLAB_VERSION, logo_version()]
+    values += [str(getattr(tcapplication, field)) for field in APPLICATION_FIELDS]
+    values += [str(getattr(student, field)) for field in STUDENT_FIELDS]
+    values.append(student.department.name if student.department else '')
+    return hashlib.sha256('\x1f'.join(values).encode()).hexdigest()
+
+
+def cache_path(kind, tcapplication, renderer=''):
+    filename = '{}-{}-{}.pdf'.format(kind, tcapplication.pk, cache_key(kind, tcapplication, renderer))
+    return os.path.join(settings.TC_PDF_CACHE_DIR, filename)
+
+
+def get(kind, tcapplication, renderer=''):
+    path = cache_path(kind, tcapplication, renderer)
+    try:
+        with open(path, 'rb') as f:
+            pdf = f.read()
+    except FileNotFoundError:
+        return None
+    # the modification time doubles as the last-used time for eviction
+    os.utime(path)
+    return pdf
+
+
+def put(kind, tcapplication, pdf, renderer=''):
+    global _written_since_evict
+    os.makedirs(settings.TC_PDF_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=settings.TC_PDF_CACHE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, cache_path(kind, tcapplication, renderer))
+    _written_since_evict += len(pdf)
+    if time.monotonic() - _last_evict >= EVICT_INTERVAL \
+            or _written_since_evict >= settings.TC_PDF_CACHE_MAX_BYTES * EVICT_AFTER_SHARE:
+        evict()
+
+
+def get_or_render(kind, tcapplication, render, renderer=''):
+    """The cached PDF, or render() stored under the name of the renderer function it calls."""
+    pdf = get(kind, tcapplication, renderer)
+    if pdf is None:
+        pdf = render()
+        put(kind, tcapplication, pdf, renderer)
+    return pdf
+
+
+def evict(max_bytes=None):
+    """Removes the least recently used PDFs until the cache fits in TC_PDF_CACHE_MAX_BYTES."""
+    global _last_evict, _written_since_evict
+    _last_evict = time.monotonic()
+    _written_since_evict = 0
+    max_bytes = settings.TC_PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for entry in os.scandir(settings.TC_PDF_CACHE_DIR):
+        if entry.name.endswith('.pdf'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return
+    for mtime, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+def invalidate(application_id):
+    for path in glob.glob(os.path.join(settings.TC_PDF_CACHE_DIR, '*-{}-*.pdf'.format(application_id))):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
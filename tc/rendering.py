@@ -0,0 +1,378 @@
+import copy
+import hashlib
+import io
+import logging
+import re
+from collections import OrderedDict, deque
+from itertools import islice
+
+from django.conf import settings
+from pypdf import PdfReader
+from pypdf.generic import (ArrayObject, DictionaryObject, EncodedStreamObject,
+                           IndirectObject, NameObject, NumberObject, StreamObject)
+from reportlab import Version as REPORTLAB_VERSION
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Table
+
+from common.executors import submit_heavy
+from common.profiling import timed
+
+logger = logging.getLogger(__name__)
+
+
+def make_doc(buffer, doc_options):
+    doc = SimpleDocTemplate(buffer)
+    for name, value in doc_options.items():
+        setattr(doc, name, value)
+    return doc
+
+
+def render_pdf(elements, page_setup, doc_options):
+    """Builds one PDF from a story and returns its bytes.
+
+    doc_options are set as attributes on the SimpleDocTemplate (margins, mytype).
+    """
+    buffer = io.BytesIO()
+    doc = make_doc(buffer, doc_options)
+    with timed('pdf'):
+        doc.build(elements, onFirstPage=page_setup, onLaterPages=page_setup)
+    return buffer.getvalue()
+
+
+# the ReportLab series draw_pdf's layout replay is written and tested against. It
+# reads private Platypus attributes (SimpleDocTemplate._calc, Table._argW,
+# _cellvalues, ...), so under any other series draw_pdf is plain render_pdf
+REPLAY_REPORTLAB = '3.6'
+replay_enabled = REPORTLAB_VERSION.startswith(REPLAY_REPORTLAB + '.')
+# layouts of single-page stories drawn by draw_pdf, keyed on story_shape()
+LAYOUT_CACHE_SIZE = 64
+_layouts = OrderedDict()
+# available height when measuring; paragraph heights do not depend on it
+A_LOT = 1e6
+
+
+class Layout:
+    """Where each flowable of a single-page story was drawn, plus its laid out tables."""
+
+    def __init__(self, story):
+        self.positions = [None] * len(story)
+        self.tables = {}
+        for index, flowable in enumerate(story):
+            flowable.drawOn = self._recorder(index, flowable, flowable.drawOn)
+
+    def _recorder(self, index, flowable, drawOn):
+        def record(canvas, x, y, _sW=0):
+            self.positions[index] = (canvas.getPageNumber(), x, y, _sW)
+            if isinstance(flowable, Table):
+                self.tables[index] = flowable
+            return drawOn(canvas, x, y, _sW=_sW)
+        return record
+
+    def stop_recording(self, story):
+        for flowable in story:
+            del flowable.drawOn
+
+    def complete(self):
+        # every flowable drawn unsplit on the first page
+        return all(position is not None and position[0] == 1 for position in self.positions)
+
+
+def _wrapped(paragraph, width):
+    # the table wraps its cells again at the same width when drawn; the lines
+    # broken while measuring are still on the paragraph
+    wrap = paragraph.wrap
+    size = (paragraph.width, paragraph.height)
+
+    def cached(availWidth, availHeight):
+        if availWidth == width:
+            return size
+        return wrap(availWidth, availHeight)
+    return cached
+
+
+def story_shape(story, width):
+    """Everything that decides where a story's flowables and table rows end up.
+
+    Stories with the same shape are laid out identically, so the layout of one
+    can be reused to draw the other. Returns None for stories the cached
+    layout cannot draw: a table value wider than its cell, spans, or flowables
+    other than paragraphs and tables.
+    """
+    shape = []
+    for flowable in story:
+        if isinstance(flowable, Paragraph):
+            shape.append((flowable.wrap(width, A_LOT)[1], flowable.getSpaceBefore(), flowable.getSpaceAfter()))
+        elif isinstance(flowable, Table) and not flowable._spanCmds and None not in flowable._argW:
+            shape.append((tuple(flowable._argW), tuple(flowable._argH)))
+            for row, row_styles in zip(flowable._cellvalues, flowable._cellStyles):
+                for value, style, cell_width in zip(row, row_styles, flowable._argW):
+                    inner = cell_width - style.leftPadding - style.rightPadding
+                    if isinstance(value, Paragraph):
+                        measure = value.wrap(inner, A_LOT)[1]
+                        value.wrap = _wrapped(value, inner)
+                    elif isinstance(value, (str, int, float)) or value is None:
+                        lines = str(value).split('\n')
+                        if any(stringWidth(line, style.fontname, style.fontsize) > inner for line in lines):
+                            return None
+                        measure = len(lines)
+                    else:
+                        return None
+                    shape.append((measure, style.fontsize, style.leading, style.valign, style.topPadding,
+                                  style.bottomPadding, style.leftPadding, style.rightPadding))
+        else:
+            return None
+    return tuple(shape)
+
+
+def draw_pdf(elements, page_setup, doc_options):
+    """Same document as render_pdf, drawn from a cached layout when possible.
+
+    The first story of each shape goes through Platypus as usual, and the
+    positions it was drawn at are kept. Later stories of that shape skip the
+    document, frame and table layout: their values are drawn straight onto a
+    canvas at the recorded positions. Stories that do not fit on one page or
+    whose values overflow their cells always go through Platypus, and so does
+    everything once the replay has failed (see REPLAY_REPORTLAB).
+    """
+    with timed('pdf'):
+        if not replay_enabled:
+            return render_pdf(elements, page_setup, doc_options)
+        return _draw_pdf(elements, page_setup, doc_options)
+
+
+def _disable_replay(error):
+    global replay_enabled
+    replay_enabled = False
+    _layouts.clear()
+    logger.warning('PDF layout replay failed under ReportLab %s, rendering every PDF with Platypus: %r',
+                   REPORTLAB_VERSION, error)
+
+
+def _draw_pdf(elements, page_setup, doc_options):
+    buffer = io.BytesIO()
+    doc = make_doc(buffer, doc_options)
+    try:
+        doc._calc()
+        # the width SimpleDocTemplate's frame leaves after its 6pt padding
+        shape = story_shape(elements, doc.width - 12)
+    except (AttributeError, TypeError) as e:
+        _disable_replay(e)
+        return render_pdf(elements, page_setup, doc_options)
+    layout = _layouts.get(shape) if shape is not None else None
+    if layout is None:
+        if shape is None:
+            return render_pdf(elements, page_setup, doc_options)
+        # build() empties the list it is given
+        story = list(elements)
+        layout = Layout(story)
+        try:
+            doc.build(elements, onFirstPage=page_setup, onLaterPages=page_setup)
+        finally:
+            layout.stop_recording(story)
+        if layout.complete():
+            _layouts[shape] = layout
+            while len(_layouts) > LAYOUT_CACHE_SIZE:
+                _layouts.popitem(last=False)
+        return buffer.getvalue()
+    try:
+        return _replay(doc, buffer, layout, elements, page_setup)
+    except (AttributeError, TypeError, ValueError) as e:
+        # nothing of the story is used up by a replay, so Platypus can still have all of it
+        _disable_replay(e)
+        return render_pdf(elements, page_setup, doc_options)
+
+
+def _replay(doc, buffer, layout, elements, page_setup):
+    canvas = doc._makeCanvas(filename=buffer)
+    page_setup(canvas, doc)
+    for index, flowable in enumerate(elements):
+        page, x, y, slack = layout.positions[index]
+        if index in layout.tables:
+            # the laid out table with this story's values and styles in it
+            table = copy.copy(layout.tables[index])
+            table._cellvalues = flowable._cellvalues
+            table._cellStyles = flowable._cellStyles
+            table._linecmds = flowable._linecmds
+            table._bkgrndcmds = flowable._bkgrndcmds
+            flowable = table
+        flowable.drawOn(canvas, x, y, _sW=slack)
+    canvas.showPage()
+    canvas.save()
+    return buffer.getvalue()
+
+
+# page objects in ReportLab and pypdf output; the page tree, /Pages, does not match
+PAGE_OBJECT = re.compile(rb'/Type\s*/Page\b')
+
+
+def count_pages(pdf):
+    return len(PAGE_OBJECT.findall(pdf))
+
+
+def render_chunk(applications, prepare, page_setup, doc_options):
+    elements = []
+    for application in applications:
+        elements.extend(prepare(application))
+        elements.append(PageBreak())
+    return render_pdf(elements, page_setup, doc_options)
+
+
+class PdfStreamWriter:
+    """Concatenates PDFs into a single document, returning output as each part is added.
+
+    Objects of a part are renumbered and written out straight away, so only
+    the byte offsets of written objects are kept between parts. Images and
+    form XObjects that repeat across parts (the logo) are written once.
+    """
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.next_id = 3
+        self.pages = []
+        self.shared = {}
+
+    def header(self):
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def add(self, pdf):
+        reader = PdfReader(io.BytesIO(pdf))
+        self.ids = {}
+        self.queue = deque()
+        for page in reader.pages:
+            self.pages.append(self._new_id(page.indirect_reference))
+        out = io.BytesIO()
+        while self.queue:
+            old, new_id = self.queue.popleft()
+            obj = self._copy(old.get_object())
+            if isinstance(obj, DictionaryObject) and obj.get('/Type') == '/Page':
+                obj[NameObject('/Parent')] = IndirectObject(self.PAGES, 0, None)
+            out.write(self._object(new_id, obj))
+        return out.getvalue()
+
+    def close(self):
+        out = io.BytesIO()
+        out.write(self._object(self.PAGES, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(IndirectObject(page, 0, None) for page in self.pages),
+            NameObject('/Count'): NumberObject(len(self.pages)),
+        })))
+        out.write(self._object(self.CATALOG, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.PAGES, 0, None),
+        })))
+        xref = io.BytesIO()
+        xref.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for object_id in range(1, self.next_id):
+            xref.write(b'%010d 00000 n \n' % self.offsets[object_id])
+        xref.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            self.next_id, self.CATALOG, self.offset))
+        out.write(self._emit(xref.getvalue()))
+        return out.getvalue()
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def _object(self, object_id, obj):
+        buffer = io.BytesIO()
+        buffer.write(b'%d 0 obj\n' % object_id)
+        obj.write_to_stream(buffer)
+        buffer.write(b'\nendobj\n')
+        self.offsets[object_id] = self.offset
+        return self._emit(buffer.getvalue())
+
+    def _new_id(self, reference):
+        key = reference.idnum
+        if key in self.ids:
+            return self.ids[key]
+        obj = reference.get_object()
+        digest = None
+        if isinstance(obj, StreamObject) and obj.get('/Subtype') in ('/Image', '/Form'):
+            digest = hashlib.sha1(repr(sorted(
+                (k, v) for k, v in obj.items() if not isinstance(v, IndirectObject))).encode()
+                + obj._data).hexdigest()
+            if digest in self.shared:
+                self.ids[key] = self.shared[digest]
+                return self.ids[key]
+        new_id = self.next_id
+        self.next_id += 1
+        self.ids[key] = new_id
+        if digest:
+            self.shared[digest] = new_id
+        self.queue.append((reference, new_id))
+        return new_id
+
+    def _copy(self, obj):
+        if isinstance(obj, IndirectObject):
+            return IndirectObject(self._new_id(obj), 0, None)
+        if isinstance(obj, StreamObject):
+            copy = EncodedStreamObject()
+            copy._data = obj._data
+            copy.update({key: self._copy(value) for key, value in obj.items() if key != '/Parent'})
+            return copy
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({key: self._copy(value) for key, value in obj.items() if key != '/Parent'})
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(value) for value in obj)
+        return obj
+
+
+def _collect(pending, chunks, prepare, page_setup, doc_options, in_flight):
+    try:
+        for chunk in chunks:
+            if len(pending) >= in_flight:
+                yield pending.popleft().result()
+            # later chunks wait for room on the executor instead of failing a response already under way
+            pending.append(submit_heavy('pdf', render_chunk, chunk, prepare, page_setup, doc_options, wait=True))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def render_parts(applications, prepare, page_setup, doc_options, workers=None, chunk_size=None):
+    """Returns an iterator of one rendered PDF per chunk of chunk_size applications, in order.
+
+    With more than one worker the chunks are rendered on the shared 'pdf'
+    executor (HEAVY_WORK_EXECUTORS), at most two per worker in flight so
+    finished parts do not pile up while the caller is still sending earlier
+    ones. The first chunk is queued straight away, and ExecutorBusy raised
+    here, while the view can still answer with a 503.
+    """
+    workers = workers or settings.TC_RENDER_WORKERS
+    chunk_size = chunk_size or settings.TC_RENDER_CHUNK_SIZE
+    applications = iter(applications)
+    chunks = iter(lambda: list(islice(applications, chunk_size)), [])
+    if workers <= 1:
+        return (render_chunk(chunk, prepare, page_setup, doc_options) for chunk in chunks)
+
+    first = next(chunks, None)
+    if first is None:
+        return iter(())
+    pending = deque([submit_heavy('pdf', render_chunk, first, prepare, page_setup, doc_options)])
+    return _collect(pending, chunks, prepare, page_setup, doc_options, workers * 2)
+
+
+def _stream(parts):
+    writer = PdfStreamWriter()
+    yield writer.header()
+    for part in parts:
+        yield writer.add(part)
+    yield writer.close()
+
+
+def stream_batch(applications, prepare, page_setup, doc_options, workers=None, chunk_size=None):
+    """Renders prepare(application) for every application as one PDF, returned as an iterator of pieces.
+
+    prepare must not touch the database, so load the related student and
+    department before calling this. Raises ExecutorBusy as render_parts() does.
+    """
+    return _stream(render_parts(applications, prepare, page_setup, doc_options, workers, chunk_size))
+
+
+def render_batch(applications, prepare, page_setup, doc_options, workers=None, chunk_size=None):
+    return b''.join(stream_batch(applications, prepare, page_setup, doc_options, workers, chunk_size))
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from students.models import Student
+from . import pdfcache
+from .models import TcApplication
+
+
+@receiver(post_save, sender=TcApplication)
+@receiver(post_delete, sender=TcApplication)
+def invalidate_application_pdfs(sender, instance, **kwargs):
+    pdfcache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Student)
+def invalidate_student_pdfs(sender, instance, **kwargs):
+    for application_id in TcApplication.objects.filter(student=instance).values_list('pk', flat=True):
+        pdfcache.invalidate(application_id)
@@ -0,0 +1,58 @@
+"""Styles and wording shared by every TC and application PDF.
+
+Built once at import. Each Paragraph and Table only keeps a reference to
+its style, so these objects are shared between certificates and must not
+be modified after import; derive a new style instead.
+"""
+from functools import lru_cache
+
+import num2words
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus.tables import TableStyle
+
+_sample = getSampleStyleSheet()
+
+NORMAL = _sample['Normal']
+HEADING = ParagraphStyle('tcHeading', parent=_sample['Heading3'], alignment=TA_CENTER)
+SUBHEADING = _sample['Heading3']
+# long questions inside the TC table
+BODY = ParagraphStyle('tcBody', parent=NORMAL, fontSize=11, leading=14, alignment=TA_JUSTIFY)
+CONDUCT = ParagraphStyle('conduct', parent=NORMAL, fontSize=12, leading=14, alignment=TA_JUSTIFY)
+
+ROW_HEIGHT = 1.4*cm
+DETAILS_TABLE = TableStyle([
+    ('GRID', (0,0), (-1,-1), 0.25, colors.black),
+    ('BOX', (0,0), (-1,-1), 0.25, colors.black),
+    ('BOTTOMPADDING',(0,0),(-1,-1),5),
+    ('TOPPADDING',(0,0),(-1,-1),5),
+    ('VALIGN', (0, 0), (1, 0), 'MIDDLE'),
+    ('FONTSIZE',(0,0),(-1,-1),11),
+])
+CONDUCT_TABLE = TableStyle([
+    ('GRID', (0,0), (-1,-1), 0.25, colors.black),
+    ('BOX', (0,0), (-1,-1), 0.25, colors.black),
+    ('BOTTOMPADDING',(0,0),(-1,-1),20),
+    ('TOPPADDING',(0,0),(-1,-1),5),
+    ('FONTSIZE',(0,0),(-1,-1),20),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+
+@lru_cache(maxsize=None)
+def ordinal_words(number):
+    return num2words.num2words(number, to='ordinal')
+
+
+@lru_cache(maxsize=None)
+def number_words(number):
+    return num2words.num2words(number)
+
+
+@lru_cache(maxsize=4096)
+def date_in_words(value):
+    """01/06/2004 First June Two Thousand And Four, as on the TC."""
+    return (value.strftime('%d/%m/%Y') + ' ' + ordinal_words(value.day) + ' '
+            + value.strftime('%B') + ' ' + number_words(value.year)).title()
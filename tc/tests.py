@@ -1,3 +1,506 @@
-from django.test import TestCase
+import csv
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from pypdf import PdfReader
+
+from admin_tools.models import AcademicSession, Classroom, Department
+from common.tests import read_xlsx
+from students.models import Student
+from . import numbering, pdfcache, rendering
+from .forms import TCIssueForm
+from .issuing import issue_all
+from .models import NumberSequence, TcApplication
+from .rendering import count_pages, draw_pdf, render_chunk, render_pdf, stream_batch
+from .views import (APPLICATION_DOC_OPTIONS, TC_DOC_OPTIONS, AllPageSetup, certificate_pdf, prepareTC,
+                    prepareTCApplication)
+
+
+def create_applications(count, start=0, issued=False):
+    department, _ = Department.objects.get_or_create(name='Computer Engineering', code='CT')
+    session, _ = AcademicSession.objects.get_or_create(year=2023)
+    classroom, _ = Classroom.objects.get_or_create(department=department, semester=6, academicyear=session)
+    for i in range(start, start + count):
+        student = Student.objects.create(
+            name='Student {}'.format(i), admission_number=str(1000 + i), department=department,
+            date_of_birth=date(2004, 1, 1), date_of_join=date(2021, 8, 1),
+            religion='Hindu', community='Ezhava', category='OBC', data_verified=True)
+        student.classroom.add(classroom)
+        TcApplication.objects.create(
+            student=student, reasonforLeaving='Course Completed',
+            tc_application_Number=i + 1, tc_application_Year=2024,
+            tcNumber=i + 1 if issued else None, tcYear=2024 if issued else None, tc_issued=issued)
+
+
+class TcListQueryCountTest(TestCase):
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_pending_list_query_count_is_constant(self):
+        create_applications(1)
+        one = self.count_queries(reverse('tc:all_tc'))
+        create_applications(10, start=1)
+        many = self.count_queries(reverse('tc:all_tc'))
+        self.assertEqual(one, many)
+
+    def test_issued_list_query_count_is_constant(self):
+        create_applications(1, issued=True)
+        one = self.count_queries(reverse('tc:all_issued_tc'))
+        create_applications(10, start=1, issued=True)
+        many = self.count_queries(reverse('tc:all_issued_tc'))
+        self.assertEqual(one, many)
+
+    def test_pending_list_shows_active_classroom(self):
+        create_applications(2)
+        response = self.client.get(reverse('tc:all_tc'))
+        self.assertContains(response, 'CTS6', count=2)
+
+
+def allocate_many(count, results):
+    try:
+        for i in range(count):
+            results.put(numbering.allocate('tc', 2024))
+    finally:
+        connections.close_all()
+
+
+class NumberingTest(TestCase):
+
+    def test_first_allocation_continues_after_existing_numbers(self):
+        create_applications(3, issued=True)
+        self.assertEqual(numbering.peek('tc', 2024), 4)
+        self.assertEqual(numbering.allocate('tc', 2024), 4)
+        self.assertEqual(numbering.allocate('tc', 2024, count=5), 5)
+        self.assertEqual(numbering.peek('tc', 2024), 10)
+        self.assertEqual(numbering.allocate('tc', 2025), 1)
+
+    def test_manual_number_moves_the_sequence_forward(self):
+        numbering.allocate('application', 2024)
+        numbering.bump('application', 2024, 40)
+        numbering.bump('application', 2024, 7)
+        self.assertEqual(numbering.allocate('application', 2024), 41)
+
+    def test_issue_without_number_allocates_one(self):
+        create_applications(2)
+        for tcapplication in TcApplication.objects.order_by('id'):
+            self.client.post(reverse('tc:tc_issue_view', args=(tcapplication.student_id,)),
+                             {'tcNumber': '', 'tcYear': '2024', 'conduct': 'Good'})
+        self.assertEqual(list(TcApplication.objects.order_by('id').values_list('tcNumber', flat=True)), [1, 2])
+
+    def test_typed_number_must_be_free_and_numeric(self):
+        create_applications(1, issued=True)
+        create_applications(1, start=1)
+        tcapplication = TcApplication.objects.get(tc_issued=False)
+        for number in ('abc', '0', '1'):
+            form = TCIssueForm({'tcNumber': number, 'tcYear': '2024', 'conduct': 'Good'}, instance=tcapplication)
+            self.assertFalse(form.is_valid(), number)
+            self.assertIn('tcNumber', form.errors)
+        # the same number is free in another year
+        self.client.post(reverse('tc:tc_issue_view', args=(tcapplication.student_id,)),
+                         {'tcNumber': '1', 'tcYear': '2025', 'conduct': 'Good'})
+        tcapplication.refresh_from_db()
+        self.assertEqual((tcapplication.tcNumber, tcapplication.tcYear, tcapplication.tc_issued), (1, 2025, True))
+
+
+class NumberingConcurrencyTest(TransactionTestCase):
+    per_worker = 25
+    workers = 4
+
+    def assertAllocatedOnce(self, results):
+        numbers = sorted(results.get(timeout=30) for i in range(self.per_worker * self.workers))
+        self.assertEqual(numbers, list(range(1, self.per_worker * self.workers + 1)))
+        self.assertEqual(NumberSequence.objects.get(kind='tc', year=2024).last_value, len(numbers))
+
+    def test_threads_never_share_a_number(self):
+        results = multiprocessing.Queue()
+        threads = [threading.Thread(target=allocate_many, args=(self.per_worker, results)) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertAllocatedOnce(results)
+
+    def test_processes_never_share_a_number(self):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        # children must open their own connections
+        connections.close_all()
+        processes = [context.Process(target=allocate_many, args=(self.per_worker, results)) for i in range(self.workers)]
+        for process in processes:
+            process.start()
+        self.assertAllocatedOnce(results)
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+
+class HotQueryPlanTest(TestCase):
+    """EXPLAINs the queries behind the busy pages and fails on a full table scan or a sort of the whole table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_applications(30)
+        create_applications(30, start=30, issued=True)
+        Student.objects.update(active=True)
+
+    def capture(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        # queries reading the big tables; lookups by a list of ids (prefetches) are bounded anyway
+        return [query['sql'] for query in queries.captured_queries
+                if re.search(r'FROM "(tc_tcapplication|students_student)"', query['sql'])]
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # with a few test rows a sequential scan is always cheapest; only fall back to one if no index fits
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            return [line for line in plan if 'Seq Scan on' in line]
+        return [line for line in plan if re.match(r'(SCAN|SEARCH) \S+$', line) or 'TEMP B-TREE' in line]
+
+    def assertIndexed(self, run):
+        queries = self.capture(run)
+        self.assertTrue(queries)
+        for sql in queries:
+            plan = self.plan(sql)
+            self.assertEqual(self.full_scans(plan), [], '{}\n{}'.format(sql, '\n'.join(plan)))
+
+    def test_pending_list(self):
+        self.assertIndexed(lambda: self.client.get(reverse('tc:all_tc')))
+
+    def test_issued_list(self):
+        self.assertIndexed(lambda: self.client.get(reverse('tc:all_issued_tc')))
+
+    def test_highest_numbers(self):
+        self.assertIndexed(lambda: numbering.highest_used('tc', 2024))
+        self.assertIndexed(lambda: numbering.highest_used('application', 2024))
+
+    def test_student_verification_lists(self):
+        self.assertIndexed(lambda: self.client.get(reverse('students:students_pending_verification')))
+        self.assertIndexed(lambda: self.client.get(reverse('students:verified_students')))
+
+
+class PageDecorationTest(TestCase):
+
+    def test_logo_is_embedded_once_per_document(self):
+        create_applications(3, issued=True)
+        applications = TcApplication.objects.select_related('student__department').order_by('id')
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(TC_PDF_CACHE_DIR=cache_dir):
+            pdf = render_chunk(applications, prepareTC, AllPageSetup, TC_DOC_OPTIONS)
+        self.assertGreaterEqual(count_pages(pdf), 3)
+        self.assertEqual(len(re.findall(rb'/Subtype /Image', pdf)), 1)
+
+
+class IssueAllTest(TestCase):
+
+    def issue_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            issued = issue_all(TcApplication.objects.filter(tc_issued=False), 2024)
+        return len(queries), issued
+
+    def test_query_count_does_not_grow_with_applications(self):
+        # the first allocation of a year seeds the sequence with a few more queries
+        numbering.allocate('tc', 2024)
+        create_applications(2)
+        few, issued = self.issue_queries()
+        self.assertEqual([tcapplication.tcNumber for tcapplication in issued], [2, 3])
+        create_applications(20, start=2)
+        many, issued = self.issue_queries()
+        self.assertEqual(len(issued), 20)
+        self.assertEqual(few, many)
+
+    def test_failed_render_leaves_nothing_issued(self):
+        create_applications(3)
+
+        def failing_render(*args, **kwargs):
+            yield b'%PDF-1.4\n'
+            raise RuntimeError('render failed')
+
+        with mock.patch('tc.views.stream_batch', failing_render), self.assertRaises(RuntimeError):
+            self.client.get(reverse('tc:issueprintpendingapplications'))
+        self.assertFalse(TcApplication.objects.filter(tc_issued=True).exists())
+        self.assertFalse(TcApplication.objects.filter(tcNumber__isnull=False).exists())
+        self.assertEqual(numbering.peek('tc'), 1)
+
+
+class BulkPrintBusyTest(TestCase):
+
+    def setUp(self):
+        create_applications(3)
+        # a 'pdf' executor with every queue slot taken
+        patcher = mock.patch('common.executors.get_executor', return_value=('process', mock.Mock(), threading.Semaphore(0)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_single_print_is_refused(self):
+        tcapplication = TcApplication.objects.first()
+        for name in ('tc:tc_print_view', 'tc:application_view'):
+            response = self.client.get(reverse(name, args=(tcapplication.student_id,)))
+            self.assertEqual(response.status_code, 503, name)
+            self.assertEqual(response['Retry-After'], '5')
+
+    def test_print_pending_is_refused(self):
+        response = self.client.get(reverse('tc:printpendingapplications'))
+        self.assertEqual(response.status_code, 503)
+
+    def test_issue_and_print_is_refused_and_undone(self):
+        response = self.client.get(reverse('tc:issueprintpendingapplications'))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(TcApplication.objects.filter(tc_issued=True).exists())
+        self.assertEqual(numbering.peek('tc'), 1)
+
+
+@mock.patch('tc.views.TC_LIST_PAGE_SIZE', 5)
+class IssuedListPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_applications(12, issued=True)
+        # issued by hand before TC numbers were recorded
+        TcApplication.objects.filter(tcNumber=7).update(tcNumber=None)
+
+    def page(self, **params):
+        response = self.client.get(reverse('tc:all_issued_tc'), params)
+        self.assertEqual(response.status_code, 200)
+        page = response.context['tcapplications']
+        return [tcapplication.tcNumber for tcapplication in page], page
+
+    def test_next_and_previous(self):
+        numbers, first = self.page()
+        self.assertEqual(numbers, [12, 11, 10, 9, 8])
+        self.assertFalse(first.has_previous())
+        numbers, second = self.page(after=first.next_cursor)
+        self.assertEqual(numbers, [6, 5, 4, 3, 2])
+        numbers, last = self.page(after=second.next_cursor)
+        self.assertEqual(numbers, [1])
+        self.assertFalse(last.has_next())
+        numbers, back = self.page(before=last.previous_cursor)
+        self.assertEqual(numbers, [6, 5, 4, 3, 2])
+        numbers, back = self.page(before=back.previous_cursor)
+        self.assertEqual(numbers, [12, 11, 10, 9, 8])
+        self.assertFalse(back.has_previous())
+
+    def test_tampered_cursor_shows_the_first_page(self):
+        for cursor in ('abc', '2024.5', '2024.None.3', '9' * 30 + '.1.1'):
+            self.assertEqual(self.page(after=cursor)[0], [12, 11, 10, 9, 8], cursor)
+            self.assertEqual(self.page(before=cursor)[0], [12, 11, 10, 9, 8], cursor)
+
+    def test_search_with_cursor(self):
+        # Student 0 to Student 11: "Student 1" matches 1, 10 and 11
+        numbers, first = self.page(a_number='Student 1')
+        self.assertEqual(numbers, [12, 11, 2])
+        self.assertFalse(first.has_next())
+        numbers, page = self.page(a_number='Student', after='2024.9.{}'.format(TcApplication.objects.get(tcNumber=9).id))
+        self.assertEqual(numbers, [8, 6, 5, 4, 3])
+
+
+class PdfCacheTest(TestCase):
+
+    def setUp(self):
+        create_applications(1, issued=True)
+        self.tcapplication = TcApplication.objects.select_related('student__department').get()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings = override_settings(TC_PDF_CACHE_DIR=cache_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.cache_dir = cache_dir.name
+        self.renders = []
+
+    def renderer(self, *args):
+        self.renders.append(1)
+        return draw_pdf(*args)
+
+    def print_tc(self):
+        return certificate_pdf('tc', self.tcapplication, self.renderer)
+
+    def cached_pdfs(self):
+        return sorted(name for name in os.listdir(self.cache_dir) if name.endswith('.pdf'))
+
+    def test_second_print_is_served_from_the_cache(self):
+        pdf = self.print_tc()
+        self.assertEqual(self.print_tc(), pdf)
+        self.assertEqual(len(self.renders), 1)
+        self.assertEqual(len(self.cached_pdfs()), 1)
+
+    def test_saving_the_application_or_student_renders_again(self):
+        self.print_tc()
+        self.tcapplication.conduct = 'Very good'
+        self.tcapplication.save()
+        self.assertEqual(self.cached_pdfs(), [])
+        self.print_tc()
+        self.tcapplication.student.save()
+        self.assertEqual(self.cached_pdfs(), [])
+        self.print_tc()
+        self.assertEqual(len(self.renders), 3)
+
+    def test_new_logo_or_renderer_renders_again(self):
+        self.print_tc()
+        with mock.patch('tc.pdfcache.logo_version', return_value='new-logo'):
+            self.print_tc()
+        certificate_pdf('tc', self.tcapplication, render_pdf)
+        self.assertEqual(len(self.renders), 2)
+        self.assertEqual(len(self.cached_pdfs()), 3)
+
+    def test_eviction_removes_least_recently_used(self):
+        for number, name in enumerate(('old', 'used', 'new')):
+            path = os.path.join(self.cache_dir, '{}.pdf'.format(name))
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(path, (number, number))
+        # reading a PDF marks it as used
+        os.utime(os.path.join(self.cache_dir, 'used.pdf'))
+        pdfcache.evict(max_bytes=200)
+        self.assertEqual(self.cached_pdfs(), ['new.pdf', 'used.pdf'])
+        pdfcache.evict(max_bytes=100)
+        self.assertEqual(self.cached_pdfs(), ['used.pdf'])
+
+    def test_eviction_is_throttled(self):
+        with mock.patch('tc.pdfcache.evict', wraps=pdfcache.evict) as evict:
+            pdfcache.evict()
+            for i in range(3):
+                pdfcache.put('tc', self.tcapplication, b'%PDF' + bytes(i))
+            self.assertEqual(evict.call_count, 1)
+            with override_settings(TC_PDF_CACHE_MAX_BYTES=10):
+                pdfcache.put('tc', self.tcapplication, b'%PDF-1.4')
+            self.assertEqual(evict.call_count, 2)
+
+
+class DrawPdfTest(TestCase):
+    kinds = (('tc', prepareTC, TC_DOC_OPTIONS), ('application', prepareTCApplication, APPLICATION_DOC_OPTIONS))
+
+    def setUp(self):
+        create_applications(3, issued=True)
+        self.applications = list(TcApplication.objects.select_related('student__department').order_by('id'))
+        for patch in (mock.patch.dict(rendering._layouts, clear=True), mock.patch.object(rendering, 'replay_enabled', True)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def read(self, pdf):
+        reader = PdfReader(io.BytesIO(pdf), strict=True)
+        return len(reader.pages), [page.extract_text() for page in reader.pages]
+
+    def test_matches_render_pdf(self):
+        for kind, prepare, doc_options in self.kinds:
+            with mock.patch.object(rendering, '_replay', wraps=rendering._replay) as replay:
+                for application in self.applications:
+                    drawn = self.read(rendering.draw_pdf(prepare(application), AllPageSetup, doc_options))
+                    rendered = self.read(render_pdf(prepare(application), AllPageSetup, doc_options))
+                    self.assertEqual(drawn, rendered, (kind, application.student.name))
+                    self.assertIn(application.student.name, drawn[1][0])
+            # the first of each kind was laid out, the others replayed
+            self.assertEqual(replay.call_count, len(self.applications) - 1, kind)
+
+    def test_failed_replay_falls_back_to_render_pdf(self):
+        application = self.applications[0]
+        rendering.draw_pdf(prepareTC(application), AllPageSetup, TC_DOC_OPTIONS)
+        with mock.patch.object(rendering, '_replay', side_effect=AttributeError('_argW')), \
+                self.assertLogs('tc.rendering', 'WARNING'):
+            pdf = rendering.draw_pdf(prepareTC(application), AllPageSetup, TC_DOC_OPTIONS)
+        self.assertEqual(self.read(pdf), self.read(render_pdf(prepareTC(application), AllPageSetup, TC_DOC_OPTIONS)))
+        self.assertFalse(rendering.replay_enabled)
+        # and no more replays
+        with mock.patch.object(rendering, '_replay') as replay:
+            rendering.draw_pdf(prepareTC(application), AllPageSetup, TC_DOC_OPTIONS)
+        replay.assert_not_called()
+
+    def test_other_reportlab_series_renders_with_platypus(self):
+        rendering.replay_enabled = False
+        with mock.patch.object(rendering, '_draw_pdf') as fast_path:
+            pdf = rendering.draw_pdf(prepareTC(self.applications[0]), AllPageSetup, TC_DOC_OPTIONS)
+        fast_path.assert_not_called()
+        self.assertEqual(self.read(pdf)[0], 1)
+
+
+class PdfStreamWriterTest(TestCase):
+
+    def setUp(self):
+        create_applications(5, issued=True)
+        self.applications = list(TcApplication.objects.select_related('student__department').order_by('id'))
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings = override_settings(TC_PDF_CACHE_DIR=cache_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_joined_parts_make_one_valid_document(self):
+        pdf = b''.join(stream_batch(self.applications, prepareTC, AllPageSetup, TC_DOC_OPTIONS, workers=1, chunk_size=2))
+        whole = render_chunk(self.applications, prepareTC, AllPageSetup, TC_DOC_OPTIONS)
+        # strict parsing fails on a wrong xref offset or a broken object
+        reader = PdfReader(io.BytesIO(pdf), strict=True)
+        self.assertEqual(len(reader.pages), count_pages(whole))
+        self.assertEqual(len(reader.pages), count_pages(pdf))
+        names = [application.student.name for application in self.applications]
+        text = ''.join(page.extract_text() for page in reader.pages)
+        # every certificate, in order
+        positions = [text.find(name) for name in names]
+        self.assertNotIn(-1, positions)
+        self.assertEqual(positions, sorted(positions))
+        # the logo repeated in each of the three parts is written once
+        self.assertEqual(len(re.findall(rb'/Subtype /Image', pdf)), 1)
+
+    def test_no_applications_is_still_a_document(self):
+        pdf = b''.join(stream_batch([], prepareTC, AllPageSetup, TC_DOC_OPTIONS, workers=1))
+        self.assertEqual(len(PdfReader(io.BytesIO(pdf), strict=True).pages), 0)
+
+
+class TcRegisterExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='x')
+        create_applications(4, issued=True)
+        create_applications(1, start=4)
+        # numbered out of creation order, one of them in the year before
+        for admission_number, number, year in (('1000', 3, 2024), ('1001', 1, 2024), ('1002', 2, 2024), ('1003', 7, 2023)):
+            TcApplication.objects.filter(student__admission_number=admission_number).update(tcNumber=number, tcYear=year)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        return self.client.get(reverse('tc:export_issued_tc'), params)
+
+    def register(self, **params):
+        response = self.export(**params)
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        return [row[:2] + row[3:4] for row in rows[1:]]
+
+    def test_register_is_in_year_and_tc_number_order(self):
+        self.assertEqual(self.register(), [['7', '2023', '1003'], ['1', '2024', '1001'], ['2', '2024', '1002'],
+                                           ['3', '2024', '1000']])
+
+    def test_year_filter(self):
+        self.assertEqual(self.register(year='2023'), [['7', '2023', '1003']])
+        self.assertEqual(self.register(year='2022'), [])
+        response = self.export(year='2024', format='xlsx')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="tc-register-2024.xlsx"')
+        rows = read_xlsx(b''.join(response.streaming_content))
+        self.assertEqual([row[3][2] for row in rows], ['Admission Number', '1001', '1002', '1000'])
+
+    def test_bad_parameters_are_refused(self):
+        for params in ({'year': '20x4'}, {'year': '-1'}, {'format': 'ods'}):
+            self.assertEqual(self.export(**params).status_code, 400, params)
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views as tc
+from .rendering import draw_pdf
 
 app_name = 'tc'
 urlpatterns = [
@@ -8,9 +9,10 @@ urlpatterns = [
     path('<int:pk>/cancel-application/',tc.CancelTcView.as_view(),name='cancel_tc'),
     path('pending/',tc.application_all_view,name='all_tc'),
      path('issued/',tc.tcissued_all_view,name='all_issued_tc'),
-    path('<int:pk>/', tc.printTCApplication.as_view(), name='application_view'),
+    path('issued/export/',tc.export_issued_tc,name='export_issued_tc'),
+    path('<int:pk>/', tc.AsyncPrintTCApplication.as_view(renderer=draw_pdf), name='application_view'),
     path('printpendingapplications/', tc.printAllPendingApplications.as_view(), name='printpendingapplications'),
     path('issueprinttcpendingapplications/', tc.IssueprintAllPendingApplications.as_view(), name='issueprintpendingapplications'),
     path('<int:pk>/issue/',tc.tcIssue.as_view(),name = 'tc_issue_view'),
-    path('<int:pk>/printtc/',tc.printTC.as_view(),name = 'tc_print_view'),
+    path('<int:pk>/printtc/',tc.AsyncPrintTC.as_view(renderer=draw_pdf),name = 'tc_print_view'),
     ]
\ No newline at end of file
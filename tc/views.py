@@ -2,19 +2,12 @@ from django.shortcuts import render
 from .forms import TcApplicationForm,TCIssueForm
 from django.contrib.auth.decorators import login_required
 from .models import TcApplication,TcIssue
-from reportlab.platypus import SimpleDocTemplate
 from reportlab.platypus.tables import Table
-from django.http import HttpResponse
-from reportlab.lib.styles import getSampleStyleSheet ,ParagraphStyle
-from reportlab.platypus.tables import Table, TableStyle
-from reportlab.lib import colors
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from admin_tools.models import Classroom
 from reportlab.platypus import Paragraph
-from django.db.models import Max
-import num2words
-from django.templatetags.static import static
-
-from reportlab.platypus import PageBreak
+from django.db import transaction
+from django.db.models import Prefetch, Q
 
 from django.shortcuts import render
 from django.views import View
@@ -22,25 +15,35 @@ from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.http import HttpResponseRedirect
 from django.urls import reverse
+from django.utils.http import content_disposition_header
 from datetime import datetime
-from django.db.models import Max
 import io
-from django.http import FileResponse
+import tempfile
+from django.http import FileResponse, StreamingHttpResponse
+from django.conf import settings
 
-from reportlab.lib.enums import TA_JUSTIFY,TA_LEFT,TA_CENTER,TA_RIGHT
+from reportlab.lib.enums import TA_LEFT,TA_CENTER,TA_RIGHT
 
 from reportlab.lib.units import inch ,cm
 from reportlab.lib.pagesizes import A4
-rowhight = 1.4*cm
 from students.models import Student
-sample_style_sheet = getSampleStyleSheet()
+from .rendering import count_pages, render_pdf, stream_batch
+from common.executors import ExecutorBusy, run_heavy
+from common.metrics import Counter, Histogram
+from common.exports import CONTENT_TYPES, export_response, model_rows
+from common.pagination import KeysetPaginator
+from . import numbering, pdfcache, styles
+from .logo import page_logo
+from .issuing import issue_all, revoke_issue
 # Create your views here.
-paragraphstyle  = ParagraphStyle(
-   'conduct',
-    parent=sample_style_sheet['Normal'],
-    fontSize=11,
-    leading=14,
-    alignment = TA_JUSTIFY,)
+# SimpleDocTemplate attributes for the two document types
+TC_DOC_OPTIONS = {'bottomMargin': .5*cm, 'topMargin': .75*cm, 'mytype': 'tc'}
+APPLICATION_DOC_OPTIONS = {'topMargin': 1*cm, 'mytype': 'application'}
+TC_LIST_PAGE_SIZE = 20
+#issued certificates are kept in memory up to this size, then spill to a temporary file
+ISSUE_SPOOL_MAX_SIZE = 16*1024*1024
+PDF_RENDER_SECONDS = Histogram('services_pdf_render_seconds', 'Time taken to render certificate PDFs, by kind (tc, application or bulk).', ['kind'])
+PDF_PAGES = Counter('services_pdf_pages_total', 'Pages of rendered certificate PDFs, by kind.', ['kind'])
    
 #@login_required
 class  ApplyTcView(View):
@@ -73,18 +76,14 @@ class  ApplyTcView(View):
                 if form.is_valid():
                     #each year tc application number should be reset. finding the maximum number in the current year
                     current_year = datetime.now().year
-                    tcApplicationNumber = TcApplication.objects.filter(tc_application_Year= current_year).aggregate(Max ('tc_application_Number')) ['tc_application_Number__max']
-                    if tcApplicationNumber == None:
-                        tcApplicationNumber = 1
-                    else:
-                        tcApplicationNumber +=1          
-                    form.instance.tc_application_Number = tcApplicationNumber
-                    form.instance.tc_application_Year = datetime.now().year
                     student = Student.objects.filter(pk=student_id).first()
                     student_id = student.id
-                    application = form.save(commit=False)
-                    application.student = student
-                    application.save()
+                    with transaction.atomic():
+                        form.instance.tc_application_Number = numbering.allocate('application', current_year)
+                        form.instance.tc_application_Year = current_year
+                        application = form.save(commit=False)
+                        application.student = student
+                        application.save()
                 else:
                     context = {}
                     context['form'] = form
@@ -146,15 +145,73 @@ class  CancelTcView(View):
         return HttpResponseRedirect(reverse('tc:all_tc'))
 
 
+def pending_applications():
+    #student, department and the active classroom for every row in three queries, however many rows there are
+    active_classrooms = Prefetch('student__classroom',
+        queryset=Classroom.objects.filter(active=True).select_related('department'),
+        to_attr='active_classrooms')
+    return TcApplication.objects.filter(tc_issued = False).select_related('student__department').prefetch_related(active_classrooms)
+
+def issued_applications():
+    return TcApplication.objects.filter(tc_issued = True).select_related('student__department')
+
+def search_applications(tcapplications, request):
+    #same search box as the students lists: admission number or name
+    searchkey = request.GET.get('a_number', '').strip()
+    if searchkey:
+        tcapplications = tcapplications.filter(Q(student__name__icontains=searchkey) | Q(student__admission_number__icontains=searchkey))
+    return tcapplications, searchkey
+
 def application_all_view(request):
-    tcapplications = TcApplication.objects.filter(tc_issued = False).order_by('id').reverse()
-    for tcapplication in tcapplications:
-        tcapplication.activeclassroom = Classroom.objects.filter(student = tcapplication.student,active=True).first()
-    return render(request, 'tc/tc_applications_all.html', {'tcapplications':tcapplications})
+    tcapplications, searchkey = search_applications(pending_applications(), request)
+    paginator = KeysetPaginator(tcapplications, ['-id'], per_page=TC_LIST_PAGE_SIZE)
+    page = paginator.get_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    for tcapplication in page:
+        tcapplication.activeclassroom = next(iter(tcapplication.student.active_classrooms), None)
+    return render(request, 'tc/tc_applications_all.html', {'tcapplications':page, 'searchkey':searchkey})
     
 def tcissued_all_view(request):
-    tcapplications = TcApplication.objects.filter(tc_issued = True).order_by('tcYear','tcNumber').reverse()
-    return render(request, 'tc/tc_issued_all.html', {'tcapplications':tcapplications})
+    tcapplications, searchkey = search_applications(issued_applications(), request)
+    paginator = KeysetPaginator(tcapplications, ['-tcYear','-tcNumber','-id'], per_page=TC_LIST_PAGE_SIZE)
+    page = paginator.get_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    return render(request, 'tc/tc_issued_all.html', {'tcapplications':page, 'searchkey':searchkey})
+
+#header and TcApplication field of each column of the issued TC register export
+TC_REGISTER_COLUMNS = [
+    ('TC Number', 'tcNumber'),
+    ('TC Year', 'tcYear'),
+    ('Date of Issue', 'dateofIssue'),
+    ('Admission Number', 'student__admission_number'),
+    ('Name', 'student__name'),
+    ('Department', 'student__department__name'),
+    ('Date of Birth', 'student__date_of_birth'),
+    ('Date of Admission', 'student__date_of_join'),
+    ('Last Enrolled Semester', 'lastclass'),
+    ("Date of Last Attendance", 'lastAttendedDate'),
+    ('Reason for Leaving', 'reasonforLeaving'),
+    ('Conduct', 'conduct'),
+    ('Application Number', 'tc_application_Number'),
+    ('Application Year', 'tc_application_Year'),
+    ('Proceeding Institution', 'proceedingInstitution'),
+]
+
+@login_required
+def export_issued_tc(request):
+    #the issued TC register of ?year= (every year if not given) in TC number order, as csv or ?format=xlsx
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in CONTENT_TYPES:
+        return HttpResponseBadRequest('format must be csv or xlsx')
+    tcapplications = issued_applications().order_by('tcYear','tcNumber','id')
+    filename = 'tc-register'
+    year = request.GET.get('year', '').strip()
+    if year:
+        if not year.isdigit():
+            return HttpResponseBadRequest('year must be a number')
+        tcapplications = tcapplications.filter(tcYear=int(year))
+        filename += '-' + year
+    fields = [field for header, field in TC_REGISTER_COLUMNS]
+    return export_response(request, export_format, filename, [header for header, field in TC_REGISTER_COLUMNS],
+                           model_rows(tcapplications, fields), sheet_name='TC Register')
 
 def tc_application_by_department_view(request, pk):
     dept_name = Department.objects.get(pk=pk)
@@ -168,57 +225,28 @@ def printtable_in_doc(elements,data,style=1):
     if(style == 1):
         table = Table(data, colWidths=270 )
     else:
-        table = Table(data, colWidths=270/2,rowHeights=rowhight ) 
-    tablestyle =   TableStyle([
-    ('GRID', (0,0), (-1,-1), 0.25, colors.black),
-    ('BOX', (0,0), (-1,-1), 0.25, colors.black),
-    ('BOTTOMPADDING',(0,0),(-1,-1),5),
-    ('TOPPADDING',(0,0),(-1,-1),5),
-    #('SPAN',(-2,-1),(-1,-1)),
-    ('VALIGN', (0, 0), (1, 0), 'MIDDLE'),
-    ('FONTSIZE',(0,0),(-1,-1),11),
-    ])
-    table.setStyle(tablestyle)
+        table = Table(data, colWidths=270/2,rowHeights=styles.ROW_HEIGHT ) 
+    table.setStyle(styles.DETAILS_TABLE)
     elements.append(table  )
 def print_conductCertificate(elements,student):
-    conductstyle  = ParagraphStyle(
-   'conduct',
-    parent=sample_style_sheet['Normal'],
-    fontSize=12,
-    leading=14,
-    alignment = TA_JUSTIFY,)
     heading = 'COURSE AND CONDUCT CERTIFICATE'
     print_heading(elements,heading)
     date_of_join = student.date_of_join.strftime("%d/%m/%Y")
     lastAttendedDate = student.lastAttendedDate.strftime("%d/%m/%Y")
     lastMonth = student.lastAttendedDate.strftime("%B")
     lastYear = student.lastAttendedDate.strftime("%Y")
-    print (student.reasonforLeaving)
     if student.reasonforLeaving == "Course Completed" :
-        data = [ Paragraph ("Certified that Shri/Kumari <b>"+student.name +"</b>  was a student in this institution of "+ student.department.name +" department from " + date_of_join + " to "+ lastAttendedDate + " and he/she completed his/her 3 year diploma programme of study in "+lastMonth + " " + lastYear +". The medium of the entire programme was English. <br/><br/> During the course of study his/her character and conduct were found <b> Good </b> <br/><br/> Place : Palakkad<br/> Date : "+student.dateofissue ,conductstyle )]
+        data = [ Paragraph ("Certified that Shri/Kumari <b>"+student.name +"</b>  was a student in this institution of "+ student.department.name +" department from " + date_of_join + " to "+ lastAttendedDate + " and he/she completed his/her 3 year diploma programme of study in "+lastMonth + " " + lastYear +". The medium of the entire programme was English. <br/><br/> During the course of study his/her character and conduct were found <b> Good </b> <br/><br/> Place : Palakkad<br/> Date : "+student.dateofissue ,styles.CONDUCT )]
     else:
-        data = [ Paragraph ("Certified that Shri/Kumari <b>"+student.name +"</b>  was a student in this institution of "+ student.department.name +" department from " + date_of_join + " to "+ lastAttendedDate + ".<br/><br/> During the course of study his/her character and conduct were found <b> Good </b> <br/> Place : Palakkad <br/> Date : "+student.dateofissue,conductstyle )]
+        data = [ Paragraph ("Certified that Shri/Kumari <b>"+student.name +"</b>  was a student in this institution of "+ student.department.name +" department from " + date_of_join + " to "+ lastAttendedDate + ".<br/><br/> During the course of study his/her character and conduct were found <b> Good </b> <br/> Place : Palakkad <br/> Date : "+student.dateofissue,styles.CONDUCT )]
     data = [data]
 
     table = Table(data, colWidths=270*2) 
-    #command ,startindex ,endindex 
-    tablestyle =   TableStyle([
-    ('GRID', (0,0), (-1,-1), 0.25, colors.black),
-    ('BOX', (0,0), (-1,-1), 0.25, colors.black),
-    ('BOTTOMPADDING',(0,0),(-1,-1),20),
-    ('TOPPADDING',(0,0),(-1,-1),5),
-    ('FONTSIZE',(0,0),(-1,-1),20),
-    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ])
-
-    table.setStyle(tablestyle)
+    table.setStyle(styles.CONDUCT_TABLE)
     elements.append(table  )
 
 def print_heading(elements,heading):
-    sample_style_sheet = getSampleStyleSheet()
-    title_style = sample_style_sheet['Heading3']
-    title_style.alignment = 1
-    paragraph_1 = Paragraph(heading,title_style )
+    paragraph_1 = Paragraph(heading,styles.HEADING )
     elements.append(paragraph_1)
 
 
@@ -254,7 +282,7 @@ def prepareTCApplication(tcapplication):
         printtable_in_doc(elements,data)
 
         
-        paragraph_1 = Paragraph("Dues if any to be furnished below",sample_style_sheet['Heading3'])
+        paragraph_1 = Paragraph("Dues if any to be furnished below",styles.SUBHEADING)
         elements.append(paragraph_1  )
         data  = [
             ("Section","Signature & Name","Section","Signature & Name"),
@@ -276,51 +304,93 @@ def prepareTCApplication(tcapplication):
         ]
         printtable_in_doc(elements,data)
         return elements
+def certificate_pdf(kind, tcapplication, renderer=render_pdf):
+    #the PDF of one TC ('tc') or application ('application'), rendered only if the PDF cache has no copy
+    if kind == 'tc':
+        prepare, doc_options = prepareTC, TC_DOC_OPTIONS
+    else:
+        prepare, doc_options = prepareTCApplication, APPLICATION_DOC_OPTIONS
+    def render():
+        with PDF_RENDER_SECONDS.time(kind=kind):
+            pdf = renderer(prepare(tcapplication), AllPageSetup, doc_options)
+        PDF_PAGES.inc(count_pages(pdf), kind=kind)
+        return pdf
+    return pdfcache.get_or_render(kind, tcapplication, render, renderer.__name__)
+
+def observed_batch(parts):
+    #a streamed bulk PDF is timed from its first part to its last, including the time spent sending them
+    pages = 0
+    with PDF_RENDER_SECONDS.time(kind='bulk'):
+        for part in parts:
+            pages += count_pages(part)
+            yield part
+    PDF_PAGES.inc(pages, kind='bulk')
+
 class  printTCApplication(View):
+    kind = 'application'
+    #render_pdf or draw_pdf, set per url with as_view(renderer=...)
+    renderer = staticmethod(render_pdf)
     def get(self,request,*args,**kwargs):
         student_id = kwargs.get('pk')
         student = Student.objects.filter(pk = student_id).first()
-        tcapplication = TcApplication.objects.filter(student=student).first()
+        tcapplication = TcApplication.objects.filter(student=student).select_related('student__department').first()
         filename = str(tcapplication.student.admission_number) + "-application.pdf"
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer)
-        
-        doc.mytype="application"
-        elements = prepareTCApplication(tcapplication)
-        doc.topMargin = 1*cm
-        doc.build(elements, onFirstPage=AllPageSetup, onLaterPages=AllPageSetup)
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=False, filename=filename)
+        pdf = certificate_pdf(self.kind, tcapplication, self.renderer)
+        return FileResponse(io.BytesIO(pdf), as_attachment=False, filename=filename)
+
+def busy_response():
+    return HttpResponse('Too many documents are being prepared, try again shortly.', status=503, headers={'Retry-After': '5'})
+
+class AsyncPrintTCApplication(printTCApplication):
+    #renders in the 'pdf' executor, so a slow build does not hold up the thread synchronous views run in under ASGI
+    async def get(self,request,*args,**kwargs):
+        tcapplication = await TcApplication.objects.filter(student_id=kwargs.get('pk')).select_related('student__department').afirst()
+        if tcapplication is None:
+            raise Http404
+        try:
+            pdf = await run_heavy('pdf', certificate_pdf, self.kind, tcapplication, self.renderer)
+        except ExecutorBusy:
+            return busy_response()
+        #not a FileResponse: ASGI would hand its iterator to the sync thread to read
+        filename = str(tcapplication.student.admission_number) + "-application.pdf"
+        return HttpResponse(pdf, content_type='application/pdf',
+                            headers={'Content-Disposition': content_disposition_header(False, filename)})
 
 
+def pdf_stream_response(pdf, filename):
+    # certificates are sent as each chunk is rendered instead of after the whole document is built
+    response = StreamingHttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = 'inline; filename="{}"'.format(filename)
+    return response
+
 class  printAllPendingApplications(View):
     def get(self,request,*args,**kwargs):
         pk = kwargs.get('pk')
-        tcapplications = TcApplication.objects.filter(tc_issued = False).order_by('student__department','student__name')
+        tcapplications = TcApplication.objects.filter(tc_issued = False).select_related('student__department').order_by('student__department','student__name')
         filename = "All-application.pdf"
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer)
-        doc.topMargin = 1*cm
-        elements =[]
-        for application in tcapplications:
-            elements.extend(prepareTCApplication(application))
-            elements.append(PageBreak())
-        doc.build(elements, onFirstPage=AllPageSetup, onLaterPages=AllPageSetup)
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=False, filename=filename)
-
-def AllPageSetup(canvas, doc):
-    canvas.saveState()
-    filename= '/var/www/services/staticfiles/images/poly-logo-2.png'
-    #filename= 'static/images/poly-logo-2.png'
-    url = static('images/poly-logo-2.png')
-    print("image url",url)
-    canvas.drawImage(filename,A4[0]/3 -1.73*cm,A4[1]/3,width=A4[0]/2,height=A4[1]/2,mask='auto',preserveAspectRatio=True, anchor='c')
+        try:
+            pdf = stream_batch(tcapplications.iterator(chunk_size=settings.TC_RENDER_CHUNK_SIZE), prepareTCApplication, AllPageSetup, APPLICATION_DOC_OPTIONS)
+        except ExecutorBusy:
+            return busy_response()
+        return pdf_stream_response(observed_batch(pdf), filename)
+
+def define_page_decoration(canvas):
+    canvas.beginForm('pageDecoration')
+    canvas.drawImage(page_logo(),A4[0]/3 -1.73*cm,A4[1]/3,width=A4[0]/2,height=A4[1]/2,preserveAspectRatio=True, anchor='c')
     #canvas.roundRect(x, y, width, height, radius, stroke=1, fill=0) 
     margin = .2 *cm
     canvas.roundRect(margin, margin, A4[0]-margin*2, A4[1]-margin*2, 1*cm, fill=0)
     margin = .2 *cm + .05*cm
     canvas.roundRect(margin, margin, A4[0]-margin*2, A4[1]-margin*2, 1*cm, fill=0)
+    canvas.endForm()
+
+def AllPageSetup(canvas, doc):
+    #the watermark and border are drawn once per document as a form and reused on every page
+    if not getattr(canvas, 'page_decoration_defined', False):
+        define_page_decoration(canvas)
+        canvas.page_decoration_defined = True
+    canvas.saveState()
+    canvas.doForm('pageDecoration')
 
     #printing principal tag in TC and CC, sicne its table style right alignment was difficult
     if hasattr(doc,"mytype"):
@@ -334,10 +404,7 @@ def AllPageSetup(canvas, doc):
 def  prepareTC(tcapplication):
     elements = []
     admission_number = tcapplication.student.admission_number
-    filename = str(tcapplication.student.admission_number) + "-application.pdf"
-    buffer = io.BytesIO()
-
-    student = Student.objects.filter(admission_number=admission_number)[0]
+    student = tcapplication.student
     heading = """GOVERNMENT POLYTECHNIC COLLEGE PALAKKAD"""
            
     print_heading(elements,heading)
@@ -348,25 +415,16 @@ def  prepareTC(tcapplication):
     else:
         feeconcession = 'No'
 
-    #date of birth in words 
-    datofbirth = student.date_of_birth.strftime("%d/%m/%Y")
-    year = student.date_of_birth.year
-    month = student.date_of_birth.strftime("%B")
-    date = student.date_of_birth.strftime("%d") 
     dateofissue = tcapplication.dateofIssue.strftime("%d/%m/%Y")
     dateofApplication = tcapplication.dateofApplication.strftime('%d/%m/%Y')
     promotionDate = tcapplication.promotionDate.strftime('%d/%m/%Y')
     lastAttendedDate = tcapplication.lastAttendedDate.strftime('%d/%m/%Y')
     tcapplication.dateofremovedfromrolls = tcapplication.lastAttendedDate
     dateofremovedfromrolls = tcapplication.dateofremovedfromrolls.strftime('%d/%m/%Y')
-    dobinwords = Paragraph (
-        (datofbirth + " " 
-        + num2words.num2words(date,to='ordinal' ) + " " 
-        + month + " " 
-        + num2words.num2words(year)).title() ,
-            sample_style_sheet['Normal'])
-
-    lastclass = num2words.num2words( tcapplication.lastclass ,to='ordinal' ).title() 
+    #date of birth in words 
+    dobinwords = Paragraph (styles.date_in_words(student.date_of_birth), styles.NORMAL)
+
+    lastclass = styles.ordinal_words( tcapplication.lastclass ).title() 
     lastclass += " Semester " +  student.department.name
     tcdata = [
     ("TC Number : "+ str(tcapplication.tcNumber)+"/"+str(tcapplication.tcYear),"Admission Number : "+ str(admission_number)),
@@ -379,12 +437,12 @@ def  prepareTC(tcapplication):
     (Paragraph ("""Whether the candidate belongs to scheduled castes or
     scheduled tribes or other backward communities or whether
     he/or she converted from scheduled castes or
-    Other backward Caste scheduled tribes""",paragraphstyle),student.category),
+    Other backward Caste scheduled tribes""",styles.BODY),student.category),
     ("Date of Birth according to admission Register", dobinwords),
     ("Class to which the pupil was last enrolled",lastclass),
     ("Date of Admission or promotion to that class",promotionDate),
     ("Whether qualified for promotion to a higher standard",tcapplication.promotedtoHigherClass),
-    (Paragraph("Whether the pupil has paid all the fee due to the institution",sample_style_sheet['Normal']),'Yes'),
+    (Paragraph("Whether the pupil has paid all the fee due to the institution",styles.NORMAL),'Yes'),
     ("Whether the pupil was in receipt of fee concession",feeconcession),
     ("Date of pupil's last attendance",lastAttendedDate),
     ("Date on which the name was removed from the rolls",dateofremovedfromrolls),
@@ -395,7 +453,7 @@ def  prepareTC(tcapplication):
     ("Institution to which the pupil intends proceeding",tcapplication.proceedingInstitution),
     ("Prepared by (Section Clerk - Syam Kumar P)",""),
     ("Verified by (Junior Superintendent - Roy .M.J)",""),
-    (Paragraph ("Date : " +dateofissue +"<br/>Place: Palakkad ",sample_style_sheet['Normal']), "" )
+    (Paragraph ("Date : " +dateofissue +"<br/>Place: Palakkad ",styles.NORMAL), "" )
     #("Place: Palakkad","")
     ]
     printtable_in_doc(elements,tcdata)
@@ -421,18 +479,14 @@ class tcIssue(View):
         instance = TcApplication.objects.filter(student=student).first()
 
         if instance.tcNumber == None: 
-            current_year = datetime.now().year
-            tcNumber = TcApplication.objects.filter(tcYear= current_year).aggregate(Max ('tcNumber')) ['tcNumber__max']
-            if tcNumber == None:
-                tcNumber = 1
-            else:
-                tcNumber +=1 
-            instance.tcNumber = tcNumber
-            instance.tcYear =current_year
+            instance.tcYear = datetime.now().year
         if instance:
             k_args['instance'] = instance
 
         form = TCIssueForm(**k_args)
+        if instance.tcNumber == None:
+            #left blank, the number is allocated when the TC is issued; this is only a preview
+            form.fields['tcNumber'].widget.attrs['placeholder'] = numbering.peek('tc', instance.tcYear)
         context['form'] = form
         context['student'] = instance.student
         return render(request,self.template_name,context)
@@ -441,65 +495,51 @@ class tcIssue(View):
         student_id = kwargs.get('pk')
         student = Student.objects.filter(pk = student_id).first()
         tcapplication = TcApplication.objects.filter(student=student).first()
-        
-        marktcIssued(tcapplication,request.POST.get('tcNumber'),request.POST.get('tcYear'))
+        form = TCIssueForm(request.POST, instance=tcapplication)
+        if not form.is_valid():
+            return render(request,self.template_name,{'form': form, 'student': tcapplication.student})
+        marktcIssued(tcapplication,form.cleaned_data['tcNumber'],form.cleaned_data['tcYear'])
 
         student_id  = tcapplication.student.id
         return HttpResponseRedirect(reverse('students:student',args=(student_id,)))
-def getNextTCnumber():
-    current_year = datetime.now().year
-    tcNumber = TcApplication.objects.filter(tcYear= current_year).aggregate(Max ('tcNumber')) ['tcNumber__max']
-    if tcNumber == None:
-        tcNumber = 1
-    else:
-        tcNumber +=1
-    return tcNumber
 def marktcIssued(tcapplication,tcNumber=None,tcyear=None):
-    if tcNumber == None:
-        tcNumber = getNextTCnumber()
-        tcyear = datetime.now().year
-    if tcyear == None:
-        tcyear = datetime.now().year
-    tcapplication.tcNumber = tcNumber
-    tcapplication.tcYear = tcyear
-    tcapplication.tc_issued = True
-    tcapplication.save()
+    tcyear = int(tcyear) if tcyear else datetime.now().year
+    with transaction.atomic():
+        if tcNumber:
+            #typed in by hand: keep the sequence ahead of it
+            tcNumber = int(tcNumber)
+            numbering.bump('tc', tcyear, tcNumber)
+        else:
+            tcNumber = numbering.allocate('tc', tcyear)
+        tcapplication.tcNumber = tcNumber
+        tcapplication.tcYear = tcyear
+        tcapplication.tc_issued = True
+        tcapplication.save()
     
-class printTC(View):
-    def get(self,request,*args,**kwargs):
-        pk = kwargs.get('pk')
-        elements=[]
-        student_id = pk
-        student = Student.objects.filter(pk = student_id).first()
-        tcapplication = TcApplication.objects.filter(student=student).first()
-        filename = str(tcapplication.student.admission_number) + "-application.pdf"
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer)
-        doc.bottomMargin = .5*cm
-        doc.topMargin = .75*cm
-        doc.mytype="tc"
-        elements =  prepareTC(tcapplication)
-        doc.build(elements, onFirstPage=AllPageSetup, onLaterPages=AllPageSetup)
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=False, filename=filename)
+class printTC(printTCApplication):
+    kind = 'tc'
+
+class AsyncPrintTC(AsyncPrintTCApplication):
+    kind = 'tc'
 class  IssueprintAllPendingApplications(View):
     def get(self,request,*args,**kwargs):
         pk = kwargs.get('pk')
-        tcapplications = TcApplication.objects.filter(tc_issued = False,student__data_verified = True).order_by('student__admission_number')
+        tcapplications = TcApplication.objects.filter(tc_issued = False,student__data_verified = True).select_related('student__department')
         filename = "All-TC.pdf"
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer)
-        doc.bottomMargin = .5*cm
-        doc.topMargin = .75*cm
-        doc.mytype="tc"
-        elements =[]
-        for application in tcapplications:
-            marktcIssued(application)
-            elements.extend(prepareTC(application))
-            elements.append(PageBreak())
-        doc.build(elements, onFirstPage=AllPageSetup, onLaterPages=AllPageSetup)
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=False, filename=filename)
-       
-
-        
\ No newline at end of file
+        #issued and committed first, so nothing else waits on the locks while the certificates render
+        tcapplications = issue_all(tcapplications)
+        #rendered in full before anything is sent, so a failed render can put the applications back to pending
+        pdf = tempfile.SpooledTemporaryFile(max_size=ISSUE_SPOOL_MAX_SIZE)
+        try:
+            for part in observed_batch(stream_batch(tcapplications, prepareTC, AllPageSetup, TC_DOC_OPTIONS)):
+                pdf.write(part)
+        except ExecutorBusy:
+            pdf.close()
+            revoke_issue(tcapplications)
+            return busy_response()
+        except BaseException:
+            pdf.close()
+            revoke_issue(tcapplications)
+            raise
+        pdf.seek(0)
+        return FileResponse(pdf, as_attachment=False, filename=filename)